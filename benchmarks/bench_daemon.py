@@ -0,0 +1,72 @@
+# -*- encoding: utf-8 -*-
+"""Benchmark the latency of a conversion job of the UK chart: a cold
+run of converter.py, against a run of the thin client converterc.py
+with the daemon converterd.py, and against a job sent to the daemon
+from a client that is already running, which is all that a script
+that sends many jobs pays for each one.
+
+usage: python benchmarks/bench_daemon.py [REPEAT]
+"""
+
+import sys, os
+import time
+import shutil
+import tempfile
+import subprocess
+
+sTopDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, sTopDir)
+import converterc
+
+def timed(fRun, iRepeat):
+    lTimes = []
+    for i in range(iRepeat):
+        fStart = time.time()
+        fRun()
+        lTimes.append(time.time() - fStart)
+    lTimes.sort()
+    return lTimes[len(lTimes) // 2]
+
+def main(lArgs):
+    iRepeat = int(lArgs[0]) if lArgs else 20
+    sCharts = os.path.join(sTopDir, 'charts')
+    os.chdir(sCharts)
+    sSocket = os.path.join(tempfile.mkdtemp(), 'converterd.sock')
+    sOutfile = os.path.join(os.path.dirname(sSocket), 'out.xml')
+    lArgs = ['--no-cache', '-o', sOutfile, 'oerp7_chart_l10n_uk.xml']
+
+    oDaemon = subprocess.Popen([sys.executable,
+                                os.path.join(sTopDir, 'converterd.py'),
+                                '--socket', sSocket, '--jobs', '1'],
+                               stderr=open(os.devnull, 'w'))
+    try:
+        while not os.path.exists(sSocket):
+            time.sleep(0.05)
+        # warm the worker
+        list(converterc.iter_results([dict(args=lArgs)], sSocket))
+
+        sys.stdout.write("UK chart, median of %d runs\n" % iRepeat)
+        fCold = timed(lambda: subprocess.check_call(
+            [sys.executable, os.path.join(sTopDir, 'converter.py')] + lArgs),
+                      iRepeat)
+        sys.stdout.write("converter.py     %8.3fs\n" % fCold)
+        fClient = timed(lambda: subprocess.check_call(
+            [sys.executable, os.path.join(sTopDir, 'converterc.py'),
+             '--socket=' + sSocket] + lArgs),
+                        iRepeat)
+        sys.stdout.write("converterc.py    %8.3fs  x%.1f\n" % (
+            fClient, fCold / fClient,))
+        def run_job():
+            for dResult in converterc.iter_results([dict(args=lArgs)], sSocket):
+                assert dResult['ok'], dResult['stderr']
+        fJob = timed(run_job, iRepeat)
+        sys.stdout.write("job to daemon    %8.3fs  x%.1f\n" % (
+            fJob, fCold / fJob,))
+    finally:
+        oDaemon.terminate()
+        oDaemon.wait()
+        shutil.rmtree(os.path.dirname(sSocket))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
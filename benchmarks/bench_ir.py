@@ -0,0 +1,90 @@
+# -*- encoding: utf-8 -*-
+"""Benchmark the memory and time of the output records of a synthetic
+chart: the account records built as lxml elements by an ElementMaker,
+as the converter did, against the slotted ir Records of ir.Maker, and
+the time to write them.
+
+Each maker is run in a fresh process, which parses the chart first,
+and the memory of the records is the growth of the RSS of the process
+while the account records are built and kept, divided by their number.
+
+usage: python benchmarks/bench_ir.py [ACCOUNTS]
+"""
+
+import sys, os
+import time
+import json
+import subprocess
+import tempfile
+
+sTopDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, sTopDir)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+lMakers = ['lxml', 'ir']
+
+def rss():
+    """The resident set size of this process in bytes, now."""
+    with open('/proc/self/statm') as oFd:
+        return int(oFd.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+def child(sMaker, sChart):
+    """Build and write the records of the chart sChart with the maker
+    sMaker, and return the measures."""
+    import gc
+    import converter
+    from lxml.builder import ElementMaker
+    os.chdir(os.path.join(sTopDir, 'charts'))
+    oConfig = converter.ChartConfig.read(os.path.join(sTopDir, 'en.cfg'))
+    oConverter = converter.Converter(oConfig=oConfig)
+    if sMaker == 'lxml':
+        oConverter.maker = ElementMaker()
+    oConverter.parse(sChart)
+    # only count the output records, not the field maps of the input
+    oConverter.dFieldMaps = None
+    gc.collect()
+
+    iStart = rss()
+    fStart = time.time()
+    lRecords = oConverter.build_account_template()
+    fBuild = time.time() - fStart
+    gc.collect()
+    iBytes = rss() - iStart
+
+    fStart = time.time()
+    with open(os.devnull, 'wb') as oFd:
+        converter.write_records(oFd, lRecords)
+    fWrite = time.time() - fStart
+    return dict(records=len(lRecords),
+                bytes_per_record=iBytes / len(lRecords),
+                build=fBuild,
+                write=fWrite,
+                )
+
+def main(lArgs):
+    iAccounts = int(lArgs[0]) if lArgs else 200000
+    (iFd, sChart,) = tempfile.mkstemp(suffix='.xml')
+    try:
+        with os.fdopen(iFd, 'w') as oFd:
+            synthetic.write_chart(oFd, iAccounts)
+        dResults = dict()
+        for sMaker in lMakers:
+            sOut = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                            '--child', sMaker, sChart])
+            dResults[sMaker] = json.loads(sOut)
+    finally:
+        os.unlink(sChart)
+    sys.stdout.write("%d account records\n" % (dResults['ir']['records'],))
+    sys.stdout.write("maker  bytes/record  build    write\n")
+    for sMaker in lMakers:
+        d = dResults[sMaker]
+        sys.stdout.write("%-5s  %12d  %6.2fs  %6.2fs\n" % (
+            sMaker, d['bytes_per_record'], d['build'], d['write'],))
+    return 0
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        sys.stdout.write(json.dumps(child(sys.argv[2], sys.argv[3])))
+        sys.exit(0)
+    sys.exit(main(sys.argv[1:]))
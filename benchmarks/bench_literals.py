@@ -0,0 +1,46 @@
+# -*- encoding: utf-8 -*-
+"""Micro-benchmark of the parsing of the eval attributes of the UK chart:
+Python's eval(), against the memoised literal parser literals.literal.
+
+usage: python benchmarks/bench_literals.py [INPUTFILE [REPEAT]]
+"""
+
+import sys, os
+import timeit
+
+sTopDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, sTopDir)
+import lxml.etree as ET
+import literals
+
+def parse_eval(lValues):
+    for sValue in lValues:
+        eval(sValue)
+
+def parse_literal(lValues):
+    for sValue in lValues:
+        literals.literal(sValue)
+
+def main(lArgs):
+    sInfile = lArgs[0] if lArgs else \
+        os.path.join(sTopDir, 'charts', 'oerp7_chart_l10n_uk.xml')
+    iRepeat = int(lArgs[1]) if len(lArgs) > 1 else 200
+    lValues = ET.parse(sInfile).xpath("/openerp/data/record/field/@eval")
+    lValues = [str(s) for s in lValues]
+    iValues = len(lValues)
+    sys.stdout.write("%d evals (%d distinct) in %s, best of 3 x %d runs\n" % (
+        iValues, len(set(lValues)), sInfile, iRepeat,))
+    fBase = None
+    for sName, oFun in [('eval', parse_eval),
+                        ('literals.literal', parse_literal),]:
+        fTime = min(timeit.repeat(lambda: oFun(lValues),
+                                  number=iRepeat, repeat=3))
+        fPerValue = fTime / iRepeat / iValues * 1e6
+        if fBase is None:
+            fBase = fPerValue
+        sys.stdout.write("%-20s %8.2f us/value  x%.1f\n" % (
+            sName, fPerValue, fBase / fPerValue,))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,62 @@
+# -*- encoding: utf-8 -*-
+"""Benchmark the targets of a --matrix: a synthetic chart converted for
+each language, with and without a taxfile, one conversion at a time,
+each parsing the chart again, against parsing and indexing it once
+and converting each target from it with Converter.convert_from.
+Both write the output of each target to memory.
+
+usage: python benchmarks/bench_matrix.py [ACCOUNTS]
+"""
+
+import sys, os
+import time
+from StringIO import StringIO
+
+sTopDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, sTopDir)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import converter
+import synthetic
+
+lTargets = [converter.default_values(sLang=sLang, sTaxfile=sTaxfile) for sLang in sorted(converter.dLang)
+            for sTaxfile in ['', 'taxes.xml']]
+
+def write(oConverter):
+    oFd = StringIO()
+    for oTree in [oConverter.outtree, oConverter.taxtree]:
+        if oTree is not None:
+            converter.write_records(oFd, oTree[0])
+    return oFd.getvalue()
+
+def main(lArgs):
+    iAccounts = int(lArgs[0]) if lArgs else 50000
+    # the xmlfile files of the config are relative to the charts
+    os.chdir(os.path.join(sTopDir, 'charts'))
+    oConfig = converter.ChartConfig.read(os.path.join(sTopDir, 'en.cfg'))
+    sChart = synthetic.make_chart(iAccounts)
+    sys.stdout.write("%d accounts, %d targets\n" % (iAccounts, len(lTargets),))
+
+    fStart = time.time()
+    lSingle = []
+    for oValues in lTargets:
+        lSingle.append(write(converter.Converter(StringIO(sChart),
+                                                 oConfig=oConfig,
+                                                 oValues=oValues)))
+    fSingle = time.time() - fStart
+    sys.stdout.write("single runs %8.2fs\n" % fSingle)
+
+    fStart = time.time()
+    oInput = converter.Converter()
+    oInput.parse(StringIO(sChart))
+    lMatrix = []
+    for oValues in lTargets:
+        oConverter = converter.Converter(oConfig=oConfig, oValues=oValues)
+        oConverter.convert_from(oInput)
+        lMatrix.append(write(oConverter))
+    fMatrix = time.time() - fStart
+    sys.stdout.write("matrix      %8.2fs  x%.1f\n" % (fMatrix, fSingle / fMatrix,))
+    assert lMatrix == lSingle, "the matrix outputs differ from the single runs"
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,50 @@
+# -*- encoding: utf-8 -*-
+"""Benchmark the wall clock time of the Converter with the --parallel
+build of the charts of accounts and taxes, against the sequential build,
+on a large synthetic chart converted with the en.cfg config.
+
+usage: python benchmarks/bench_parallel.py [ACCOUNTS [TAXES [REPEAT]]]
+"""
+
+import sys, os
+import time
+from ConfigParser import ConfigParser
+
+sTopDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, sTopDir)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from StringIO import StringIO
+import converter
+import synthetic
+
+def main(lArgs):
+    iAccounts = int(lArgs[0]) if lArgs else 20000
+    iTaxes = int(lArgs[1]) if len(lArgs) > 1 else iAccounts // 2
+    iRepeat = int(lArgs[2]) if len(lArgs) > 2 else 3
+    # the xmlfile files of the config are relative to the charts
+    os.chdir(os.path.join(sTopDir, 'charts'))
+    sConfigFile = os.path.join(sTopDir, 'en.cfg')
+    oConfig = ConfigParser()
+    oConfig.readfp(open(sConfigFile))
+    oConfig.sConfigFile = sConfigFile
+    sChart = synthetic.make_chart(iAccounts, iTaxes // 4, iTaxes)
+
+    sys.stdout.write("%d accounts, %d taxes, best of %d\n" % (
+        iAccounts, iTaxes, iRepeat,))
+    dTimes = dict()
+    for bParallel in [False, True]:
+        oValues = converter.default_values(sTaxfile='taxes.xml',
+                                           bParallel=bParallel)
+        lTimes = []
+        for i in range(iRepeat):
+            fStart = time.time()
+            converter.Converter(StringIO(sChart), oConfig=oConfig, oValues=oValues)
+            lTimes.append(time.time() - fStart)
+        dTimes[bParallel] = min(lTimes)
+    sys.stdout.write("sequential %8.2fs\n" % dTimes[False])
+    sys.stdout.write("parallel   %8.2fs  x%.2f\n" % (
+        dTimes[True], dTimes[False] / dTimes[True],))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,102 @@
+# -*- encoding: utf-8 -*-
+"""Benchmark the load time of a synthetic chart into SQLite: the bulk
+SQL of the --sql output, against a load of the XML output one record
+at a time, as the XML loader of the Tryton module installer does it,
+looking up each ref in ir_model_data and running each search.
+Both load into the stand-in schema of sqlout, with the foreign keys on.
+
+usage: python benchmarks/bench_sql.py [ACCOUNTS]
+"""
+
+import sys, os
+import time
+import sqlite3
+from StringIO import StringIO
+
+sTopDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, sTopDir)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import literals
+import converter
+import sqlout
+import synthetic
+
+def connect(oTables):
+    oConnection = sqlite3.connect(':memory:')
+    oConnection.execute('PRAGMA foreign_keys=ON')
+    oFd = StringIO()
+    sqlout.write_schema(oFd, oTables)
+    oConnection.executescript(oFd.getvalue())
+    return oConnection
+
+def load_records(oConnection, lRecords, sModule):
+    """Load the records one at a time, like the XML loader."""
+    oCursor = oConnection.cursor()
+    for e in lRecords:
+        sTable = sqlout.table_name(e.get('model'))
+        lColumns = []
+        lValues = []
+        for oField in e:
+            oValue = None
+            if oField.get('ref') is not None:
+                oCursor.execute('SELECT db_id FROM ir_model_data '
+                                'WHERE fs_id = ? AND module = ?',
+                                (oField.get('ref'), sModule,))
+                oRow = oCursor.fetchone()
+                oValue = oRow and oRow[0]
+            elif oField.get('search') is not None:
+                oMatch = sqlout.oSearchByCode.match(oField.get('search'))
+                if oMatch:
+                    oCursor.execute('SELECT id FROM %s WHERE code = ?' %
+                                    sqlout.quote(sqlout.table_name(oField.get('model'))),
+                                    (oMatch.group(1),))
+                    lRows = oCursor.fetchall()
+                    oValue = len(lRows) == 1 and lRows[0][0] or None
+            elif oField.get('eval') is not None:
+                oValue = literals.literal(oField.get('eval'))
+                if isinstance(oValue, list):
+                    oValue = None
+                elif not isinstance(oValue, (bool, int, long, float,)):
+                    oValue = str(oValue)
+            else:
+                oValue = oField.text
+            lColumns.append(sqlout.quote(oField.get('name')))
+            lValues.append(oValue)
+        oCursor.execute('INSERT INTO %s (%s) VALUES (%s)' % (
+            sqlout.quote(sTable), ', '.join(lColumns),
+            ', '.join(['?'] * len(lValues)),), lValues)
+        oCursor.execute('INSERT INTO ir_model_data (fs_id, model, module, db_id) '
+                        'VALUES (?, ?, ?, ?)',
+                        (e.get('id'), e.get('model'), sModule, oCursor.lastrowid,))
+    oConnection.commit()
+
+def main(lArgs):
+    iAccounts = int(lArgs[0]) if lArgs else 20000
+    # the xmlfile files of the config are relative to the charts
+    os.chdir(os.path.join(sTopDir, 'charts'))
+    oConfig = converter.ChartConfig.read(os.path.join(sTopDir, 'en.cfg'))
+    sChart = synthetic.make_chart(iAccounts)
+    oValues = converter.default_values()
+    oConverter = converter.Converter(StringIO(sChart), oConfig=oConfig,
+                                     oValues=oValues)
+    lRecords = list(oConverter.outtree[0])
+    oTables = sqlout.Tables(lRecords)
+    sys.stdout.write("%d accounts, %d records\n" % (iAccounts, len(lRecords),))
+
+    oConnection = connect(oTables)
+    fStart = time.time()
+    load_records(oConnection, lRecords, oValues.sSqlModule)
+    fXml = time.time() - fStart
+    sys.stdout.write("record at a time %8.2fs\n" % fXml)
+
+    oConnection = connect(oTables)
+    fStart = time.time()
+    oFd = StringIO()
+    sqlout.write_insert(oFd, oTables, oValues.sSqlModule, False)
+    oConnection.executescript(oFd.getvalue())
+    fSql = time.time() - fStart
+    sys.stdout.write("bulk SQL         %8.2fs  x%.1f\n" % (fSql, fXml / fSql,))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,117 @@
+# -*- encoding: utf-8 -*-
+"""Benchmark the throughput of the Converter on synthetic charts of
+increasing size, converted with the en.cfg config: the records/sec,
+the wall time of each stage of the Converter, and the peak RSS.
+
+Each size is converted in a fresh process, so that the peak RSS of
+one size is not that of the largest before it. The results are
+written as JSON, to compare the runs of different revisions.
+
+usage: python benchmarks/bench_throughput.py [options] [ACCOUNTS ...]
+"""
+
+import sys, os
+import time
+import json
+import platform
+import resource
+import subprocess
+import tempfile
+from optparse import OptionParser
+
+sTopDir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, sTopDir)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import synthetic
+
+lDefaultSizes = [1000, 10000, 100000]
+
+def child(sChart):
+    """Convert the chart sChart, and return the measures of the conversion."""
+    import converter
+    import stageprofile
+    oProfiler = stageprofile.StageProfiler()
+    # the xmlfile files of the config are relative to the charts
+    os.chdir(os.path.join(sTopDir, 'charts'))
+    oConfig = converter.ChartConfig.read(os.path.join(sTopDir, 'en.cfg'))
+
+    fStart = time.time()
+    oValues = converter.default_values(sOutfile=os.devnull)
+    oConverter = converter.Converter(sChart, oConfig=oConfig, oValues=oValues,
+                                     lHooks=[oProfiler])
+    oConverter.write()
+    fTotal = time.time() - fStart
+
+    iRecords = len(oConverter.intree.xpath('/openerp/data/record'))
+    dTimes = dict()
+    for dStage in oProfiler.lStages:
+        dTimes[dStage['stage']] = dTimes.get(dStage['stage'], 0.0) + dStage['wall']
+    return dict(records=iRecords,
+                output_records=len(oConverter.outtree[0]),
+                wall=fTotal,
+                records_per_sec=iRecords / fTotal,
+                stages=dTimes,
+                # kilobytes on Linux
+                peak_rss_kb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                )
+
+def run(iAccounts, iDepth):
+    """Make a chart of iAccounts accounts, and convert it in a child process."""
+    (iFd, sChart,) = tempfile.mkstemp(suffix='.xml')
+    try:
+        with os.fdopen(iFd, 'w') as oFd:
+            synthetic.write_chart(oFd, iAccounts, iDepth=iDepth)
+        sOut = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                        '--child', sChart])
+    finally:
+        os.unlink(sChart)
+    dResult = json.loads(sOut)
+    dResult['accounts'] = iAccounts
+    return dResult
+
+def main(lArgs):
+    oParser = OptionParser(usage=__doc__)
+    oParser.add_option("-o", "--outfile",
+                       action="store", dest="sOutfile",
+                       default=None,
+                       help="the JSON file of the results, defaults to stdout")
+    oParser.add_option("-d", "--depth",
+                       action="store", dest="iDepth", type="int",
+                       default=3,
+                       help="the number of levels of views above the accounts")
+    oParser.add_option("--child",
+                       action="store", dest="sChild",
+                       default=None,
+                       help="(internal) convert this chart and print its measures")
+    (oValues, lArguments) = oParser.parse_args(lArgs)
+    if oValues.sChild:
+        json.dump(child(oValues.sChild), sys.stdout)
+        return 0
+
+    lSizes = [int(s) for s in lArguments] or lDefaultSizes
+    lResults = []
+    for iAccounts in lSizes:
+        dResult = run(iAccounts, oValues.iDepth)
+        sys.stderr.write("%8d accounts %8.2fs %10.0f records/sec %8d KB\n" % (
+            iAccounts, dResult['wall'], dResult['records_per_sec'],
+            dResult['peak_rss_kb'],))
+        lResults.append(dResult)
+
+    import lxml.etree
+    dReport = dict(date=time.strftime('%Y-%m-%dT%H:%M:%S'),
+                   python=platform.python_version(),
+                   lxml=lxml.etree.__version__,
+                   machine=platform.machine(),
+                   depth=oValues.iDepth,
+                   results=lResults,
+                   )
+    if oValues.sOutfile:
+        with open(oValues.sOutfile, 'w') as oFd:
+            json.dump(dReport, oFd, indent=2, sort_keys=True)
+    else:
+        json.dump(dReport, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,59 @@
+# -*- encoding: utf-8 -*-
+"""Micro-benchmark of the per-record field lookups of the converter
+on the NL chart: an XPath string that is parsed on every call,
+a precompiled XPath with the name as a variable, and converter.field_map.
+
+usage: python benchmarks/bench_xpath.py [INPUTFILE [REPEAT]]
+"""
+
+import sys, os
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import lxml.etree as ET
+import converter
+
+# the fields that the account and tax code stages look up per record
+lFields = ['name', 'code', 'type', 'user_type', 'reconcile', 'parent_id']
+
+def lookup_string(lRecords):
+    for e in lRecords:
+        for sName in lFields:
+            e.xpath("field[@name='%s']" % sName)
+
+def lookup_compiled(lRecords):
+    oXPath = ET.XPath("field[@name=$name]")
+    for e in lRecords:
+        for sName in lFields:
+            oXPath(e, name=sName)
+
+def lookup_field_map(lRecords):
+    for e in lRecords:
+        dFields = converter.field_map(e)
+        for sName in lFields:
+            dFields.get(sName)
+
+def main(lArgs):
+    sInfile = lArgs[0] if lArgs else \
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                     converter.INFILE)
+    iRepeat = int(lArgs[1]) if len(lArgs) > 1 else 20
+    lRecords = ET.parse(sInfile).xpath("/openerp/data/record")
+    iRecords = len(lRecords)
+    sys.stdout.write("%d records in %s, best of 3 x %d runs\n" % (
+        iRecords, sInfile, iRepeat,))
+    fBase = None
+    for sName, oFun in [('xpath string', lookup_string),
+                        ('precompiled XPath', lookup_compiled),
+                        ('field_map', lookup_field_map),]:
+        fTime = min(timeit.repeat(lambda: oFun(lRecords),
+                                  number=iRepeat, repeat=3))
+        fPerRecord = fTime / iRepeat / iRecords * 1e6
+        if fBase is None:
+            fBase = fPerRecord
+        sys.stdout.write("%-20s %8.2f us/record  x%.1f\n" % (
+            sName, fPerRecord, fBase / fPerRecord,))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,145 @@
+# -*- encoding: utf-8 -*-
+"""Make synthetic OpenERP charts, that the converter can convert
+with the en.cfg config, to benchmark the converter on large charts.
+
+The accounts hang from a tree of views under the root account, DEPTH
+levels deep, and the taxes have all of the tax code and sign fields.
+
+usage: python benchmarks/synthetic.py [options] ACCOUNTS > chart.xml
+"""
+
+import sys
+from optparse import OptionParser
+
+# the account.account.type ids, and the OpenERP account type of each
+lAccountTypes = [('account_type_view', 'view'),
+                 ('account_type_income', 'other'),
+                 ('account_type_expense', 'other'),
+                 ('account_type_receivable', 'receivable'),
+                 ('account_type_payable', 'payable'),
+                 ]
+
+# the number of children of each view
+iBranching = 10
+
+def iter_chart(iAccounts, iTaxCodes=None, iTaxes=None, iDepth=3):
+    """Yield the lines of an OpenERP chart with iAccounts accounts under
+    a tree of views iDepth levels deep, and iTaxCodes tax codes and
+    iTaxes taxes (each defaults to a tenth of the accounts).
+    """
+    if iTaxCodes is None:
+        iTaxCodes = max(1, iAccounts // 10)
+    if iTaxes is None:
+        iTaxes = max(1, iAccounts // 10)
+    yield '<?xml version="1.0" encoding="utf-8"?>'
+    yield '<openerp>'
+    yield '    <data noupdate="True">'
+    for (sId, sType,) in lAccountTypes:
+        yield '        <record model="account.account.type" id="%s">' % sId
+        yield '            <field name="name">%s</field>' % sId[13:].title()
+        yield '            <field name="code">%s</field>' % sId[13:]
+        yield '            <field name="close_method">balance</field>'
+        yield '        </record>'
+
+    yield '        <record id="uk0" model="account.account.template">'
+    yield '            <field name="name">Synthetic Chart</field>'
+    yield '            <field name="code">0</field>'
+    yield '            <field name="type">view</field>'
+    yield '            <field name="user_type" ref="account_type_view"/>'
+    yield '        </record>'
+    # the views, a level at a time, so that parents come before children
+    lParents = ['uk0']
+    for iLevel in range(1, iDepth + 1):
+        lViews = []
+        for i in range(len(lParents) * iBranching):
+            sId = 'v%d_%d' % (iLevel, i,)
+            yield '        <record id="%s" model="account.account.template">' % sId
+            yield '            <field name="name">View %d.%d</field>' % (iLevel, i,)
+            yield '            <field name="code">V%d.%d</field>' % (iLevel, i,)
+            yield '            <field name="type">view</field>'
+            yield '            <field name="user_type" ref="account_type_view"/>'
+            yield '            <field name="parent_id" ref="%s"/>' % lParents[i // iBranching]
+            yield '        </record>'
+            lViews.append(sId)
+        lParents = lViews
+    for i in range(iAccounts):
+        (sUserType, sType,) = lAccountTypes[1 + i % 4]
+        yield '        <record id="a%d" model="account.account.template">' % i
+        yield '            <field name="name">Synthetic account %d</field>' % i
+        yield '            <field name="code">%d</field>' % (100000 + i)
+        yield '            <field name="type">%s</field>' % sType
+        yield '            <field name="user_type" ref="%s"/>' % sUserType
+        yield '            <field name="parent_id" ref="%s"/>' % lParents[i % len(lParents)]
+        yield '            <field name="reconcile" eval="%s"/>' % (i % 2 == 0)
+        yield '        </record>'
+
+    yield '        <record id="tc0" model="account.tax.code.template">'
+    yield '            <field name="name">Synthetic Tax Codes</field>'
+    yield '            <field name="code">0</field>'
+    yield '            <field name="parent_id" eval="False"/>'
+    yield '        </record>'
+    for i in range(1, iTaxCodes + 1):
+        yield '        <record id="tc%d" model="account.tax.code.template">' % i
+        yield '            <field name="name">Synthetic tax code %d</field>' % i
+        yield '            <field name="code">%d</field>' % i
+        # the tax codes are a tree too
+        yield '            <field name="parent_id" ref="tc%d"/>' % (i // iBranching)
+        yield '        </record>'
+
+    for i in range(iTaxes):
+        iCode = 1 + i % iTaxCodes
+        iRefCode = 1 + (i + 1) % iTaxCodes
+        yield '        <record id="t%d" model="account.tax.template">' % i
+        yield '            <field name="name">Synthetic tax %d</field>' % i
+        yield '            <field name="description">T%d</field>' % i
+        yield '            <field eval="%d.5" name="amount"/>' % (i % 20)
+        yield '            <field name="type">percent</field>'
+        yield '            <field name="account_collected_id" ref="%d"/>' % (100000 + i % iAccounts)
+        yield '            <field name="account_paid_id" ref="%d"/>' % (100000 + (i + 1) % iAccounts)
+        yield '            <field name="base_code_id" ref="%d"/>' % iCode
+        yield '            <field name="tax_code_id" ref="%d"/>' % iCode
+        yield '            <field name="ref_base_code_id" ref="%d"/>' % iRefCode
+        yield '            <field name="ref_tax_code_id" ref="%d"/>' % iRefCode
+        yield '            <field name="base_sign" eval="1"/>'
+        yield '            <field name="tax_sign" eval="1"/>'
+        yield '            <field name="ref_base_sign" eval="-1"/>'
+        yield '            <field name="ref_tax_sign" eval="-1"/>'
+        yield '            <field name="type_tax_use">%s</field>' % ('sale', 'purchase')[i % 2]
+        yield '        </record>'
+    yield '    </data>'
+    yield '</openerp>'
+
+def write_chart(oFd, *lArgs, **dArgs):
+    """Write the chart of iter_chart to the file oFd."""
+    for sLine in iter_chart(*lArgs, **dArgs):
+        oFd.write(sLine)
+        oFd.write('\n')
+
+def make_chart(*lArgs, **dArgs):
+    """Return the chart of iter_chart as a string."""
+    return '\n'.join(iter_chart(*lArgs, **dArgs)) + '\n'
+
+def main(lArgs):
+    oParser = OptionParser(usage=__doc__)
+    oParser.add_option("-c", "--taxcodes",
+                       action="store", dest="iTaxCodes", type="int",
+                       default=None,
+                       help="the number of tax codes (defaults to a tenth of the accounts)")
+    oParser.add_option("-t", "--taxes",
+                       action="store", dest="iTaxes", type="int",
+                       default=None,
+                       help="the number of taxes (defaults to a tenth of the accounts)")
+    oParser.add_option("-d", "--depth",
+                       action="store", dest="iDepth", type="int",
+                       default=3,
+                       help="the number of levels of views above the accounts")
+    (oValues, lArguments) = oParser.parse_args(lArgs)
+    if len(lArguments) != 1:
+        oParser.print_help()
+        return 1
+    write_chart(sys.stdout, int(lArguments[0]), oValues.iTaxCodes,
+                oValues.iTaxes, oValues.iDepth)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,109 @@
+# -*- encoding: utf-8 -*-
+"""An on-disk cache of the output files of the converter,
+keyed on a hash of everything that goes into a conversion:
+the input, the config, its xmlfile files and the converter itself.
+
+Each entry is a directory named by its key, holding a copy of each
+of the output files. The entries are evicted least recently used
+first, when the cache grows over its size.
+"""
+
+import os
+import shutil
+import hashlib
+import tempfile
+
+def default_dir():
+    sDir = os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(sDir, 'trytond_chart_converter')
+
+class Cache(object):
+    """
+    """
+
+    def __init__(self, sDir=None, iMaxBytes=100*1024*1024):
+        self.sDir = sDir or default_dir()
+        self.iMaxBytes = iMaxBytes
+
+    def key(self, lFiles, lValues=()):
+        """The hash of the contents of the files lFiles (a file that
+        does not exist counts as missing) and of the strings lValues.
+        """
+        oHash = hashlib.sha1()
+        for sFile in lFiles:
+            oHash.update('file\0%d\0' % len(sFile) + sFile)
+            if not sFile or not os.path.isfile(sFile):
+                oHash.update('missing\0')
+                continue
+            with open(sFile, 'rb') as oFd:
+                while True:
+                    sBlock = oFd.read(1024*1024)
+                    if not sBlock:
+                        break
+                    oHash.update(sBlock)
+            oHash.update('\0')
+        for sValue in lValues:
+            oHash.update('value\0%d\0' % len(sValue) + sValue)
+        return oHash.hexdigest()
+
+    def fetch(self, sKey, dOutputs):
+        """Copy the cached files of sKey to the paths in dOutputs, a
+        dictionary of output name to path. Returns False on a miss.
+        """
+        sEntry = os.path.join(self.sDir, sKey)
+        for sName in dOutputs:
+            if not os.path.isfile(os.path.join(sEntry, sName)):
+                return False
+        for sName, sPath in dOutputs.items():
+            shutil.copyfile(os.path.join(sEntry, sName), sPath)
+        # the modification time of an entry is its last use
+        try:
+            os.utime(sEntry, None)
+        except OSError:
+            pass
+        return True
+
+    def store(self, sKey, dOutputs):
+        """Store a copy of the files in dOutputs under sKey,
+        and then evict the oldest entries if the cache is too big.
+        """
+        if not os.path.isdir(self.sDir):
+            os.makedirs(self.sDir)
+        sEntry = os.path.join(self.sDir, sKey)
+        # make the entry aside, so that nobody can see a partial one
+        sTemp = tempfile.mkdtemp(prefix='.tmp-', dir=self.sDir)
+        try:
+            for sName, sPath in dOutputs.items():
+                shutil.copyfile(sPath, os.path.join(sTemp, sName))
+            if os.path.isdir(sEntry):
+                shutil.rmtree(sEntry, ignore_errors=True)
+            os.rename(sTemp, sEntry)
+        except OSError:
+            # another process stored the same entry first
+            shutil.rmtree(sTemp, ignore_errors=True)
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the total size
+        of the cache is no more than iMaxBytes.
+        """
+        lEntries = []
+        iTotal = 0
+        for sKey in os.listdir(self.sDir):
+            if sKey.startswith('.'):
+                continue
+            sEntry = os.path.join(self.sDir, sKey)
+            if not os.path.isdir(sEntry):
+                continue
+            iSize = 0
+            for sName in os.listdir(sEntry):
+                iSize += os.path.getsize(os.path.join(sEntry, sName))
+            lEntries.append((os.path.getmtime(sEntry), iSize, sEntry,))
+            iTotal += iSize
+        lEntries.sort()
+        for (fTime, iSize, sEntry,) in lEntries:
+            if iTotal <= self.iMaxBytes:
+                break
+            shutil.rmtree(sEntry, ignore_errors=True)
+            iTotal -= iSize
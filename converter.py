@@ -13,42 +13,161 @@ Splitting the two is generally a good idea, because the account chart
 varies with the type of the company's business, but the tax chart is
 the same for all companies within a country, state or province.
 
+The INPUTFILE can also be the directory of the CSV files of an
+OpenERP chart, like the data/ directory of the addons/l10n_uk module.
+
 usage: %prog [options] INPUTFILE
 
 """
 
 import sys, os
+import re
+import copy
+import codecs
+import hashlib
+import threading
+import itertools
+from collections import OrderedDict
 import lxml.etree as ET
-from lxml.builder import ElementMaker
 from optparse import OptionParser
 from ConfigParser import ConfigParser
 
-# build the options
-usage = __doc__
-oParser = OptionParser(usage=usage)
-oParser.add_option("-o", "--outfile",
-                   action="store", dest="sOutfile", type = "string",
-                   default="",
-                   help="the Tryton output XML file to convert to, defaults to stdout")
-oParser.add_option("-x", "--taxfile",
-                   action="store", dest="sTaxfile", type = "string",
-                   default="",
-                   help="the Tryton output XML file for taxes, if you want them separately")
-oParser.add_option("-c", "--config",
-                   action="store", dest="sConfigFile", type = "string",
-                   default="",
-                   help="the config file to govern the conversion (defaults to <lang>.cfg)")
-oParser.add_option("-l", "--lang",
-                   action="store", dest="sLang",
-                   choices=['en','nl'],
-                   default='en',
-                   help="the language code to use: one of [en,nl]")
-oParser.add_option("-t", "--test",
-                   action="store_true", dest="bTest",
-                   default=False,
-                   help="run the doctests in this file")
-
-# quick and dirty
+import literals
+import ir
+
+__version__ = '0.1.0'
+
+# the source files of the modules that make the output, next to this
+# one: they are all in the key of the cache, so a change to any of them
+# is a cache miss
+lSourceFiles = ['converter.py', 'ir.py', 'literals.py', 'csvchart.py']
+# found at import, as a job of a --batch changes the working directory
+sTopDir = os.path.dirname(os.path.abspath(__file__))
+
+def make_parser():
+    """Build the OptionParser of the command line."""
+    # named for the command line, when it is run by converterd.py
+    oParser = OptionParser(usage=__doc__, prog='converter.py')
+    oParser.add_option("-o", "--outfile",
+                       action="store", dest="sOutfile", type = "string",
+                       default="",
+                       help="the Tryton output XML file to convert to, defaults to stdout")
+    oParser.add_option("-x", "--taxfile",
+                       action="store", dest="sTaxfile", type = "string",
+                       default="",
+                       help="the Tryton output XML file for taxes, if you want them separately")
+    oParser.add_option("-c", "--config",
+                       action="store", dest="sConfigFile", type = "string",
+                       default="",
+                       help="the config file to govern the conversion (defaults to <lang>.cfg)")
+    oParser.add_option("-l", "--lang",
+                       action="store", dest="sLang",
+                       choices=sorted(dLang.keys()),
+                       default='en',
+                       help="the language code to use: one of [en,nl]")
+    oParser.add_option("-s", "--stream",
+                       action="store_true", dest="bStream",
+                       default=False,
+                       help="convert the input records as they are parsed, without keeping the input document in memory")
+    oParser.add_option("-p", "--parallel",
+                       action="store_true", dest="bParallel",
+                       default=False,
+                       help="build the chart of taxes in another process, at the same time as the chart of accounts")
+    oParser.add_option("-b", "--batch",
+                       action="store", dest="sBatchFile", type = "string",
+                       default="",
+                       help="convert all of the charts listed in this manifest file, instead of INPUTFILE")
+    oParser.add_option("-j", "--jobs",
+                       action="store", dest="iJobs", type = "int",
+                       default=0,
+                       help="the number of processes for --batch and --shards (defaults to the number of cpus)")
+    oParser.add_option("-m", "--matrix",
+                       action="store", dest="sMatrixFile", type = "string",
+                       default="",
+                       help="convert INPUTFILE once for each of the targets (config, lang and output files) listed in this manifest file, parsing it only once")
+    oParser.add_option("--resolve-refs",
+                       action="store_true", dest="bResolveRefs",
+                       default=False,
+                       help="replace the searches by code in the output with refs to the records that have the code")
+    oParser.add_option("--validate",
+                       action="store_true", dest="bValidate",
+                       default=False,
+                       help="check the ids and references of the output, and report all the problems instead of writing it")
+    oParser.add_option("--previous",
+                       action="append", dest="lPrevious", type = "string",
+                       default=[],
+                       help="a previous output file: only write the records that are new or changed against it (can be repeated)")
+    oParser.add_option("--removed",
+                       action="store", dest="sRemovedFile", type = "string",
+                       default="",
+                       help="with --previous, the file to list the model and id of the removed records in (defaults to stderr)")
+    oParser.add_option("--cache-dir",
+                       action="store", dest="sCacheDir", type = "string",
+                       default="",
+                       help="the directory of the cache of converted charts (defaults to ~/.cache/trytond_chart_converter)")
+    oParser.add_option("--cache-size",
+                       action="store", dest="iCacheSize", type = "int",
+                       default=100,
+                       help="the size in megabytes that the cache is kept under (defaults to 100)")
+    oParser.add_option("--no-cache",
+                       action="store_true", dest="bNoCache",
+                       default=False,
+                       help="always convert, without looking in or storing to the cache")
+    oParser.add_option("--sql",
+                       action="store", dest="sSqlFile", type = "string",
+                       default="",
+                       help="write the records as SQL to bulk load into a new database to this file, instead of as XML")
+    oParser.add_option("--sql-format",
+                       action="store", dest="sSqlFormat", type = "choice",
+                       choices=['insert', 'copy', 'sqlite'],
+                       default="insert",
+                       help="with --sql, INSERT statements or the COPY format of psql for PostgreSQL, or INSERT statements for SQLite: one of [insert,copy,sqlite]")
+    oParser.add_option("--sql-module",
+                       action="store", dest="sSqlModule", type = "string",
+                       default="account_chart",
+                       help="with --sql, the module of the records in ir_model_data (defaults to account_chart)")
+    oParser.add_option("--sql-schema",
+                       action="store", dest="sSqlSchemaFile", type = "string",
+                       default="",
+                       help="with --sql, the file to write a stand-in schema of the tables to, to load the SQL into SQLite")
+    oParser.add_option("--shards",
+                       action="store", dest="sShardDir", type = "string",
+                       default="",
+                       help="write the records as shards, XML files to load one after the other, to this directory, with the manifest of their load order in shards.cfg, instead of to the outfile")
+    oParser.add_option("--shard-by",
+                       action="store", dest="sShardBy", type = "choice",
+                       choices=['subtree', 'count'],
+                       default="subtree",
+                       help="with --shards, a shard for each subtree of accounts under the root account, or shards of --shard-size records: one of [subtree,count]")
+    oParser.add_option("--shard-size",
+                       action="store", dest="iShardSize", type = "int",
+                       default=5000,
+                       help="with --shards, the most records in a shard, or 0 for no limit on the subtrees (defaults to 5000)")
+    oParser.add_option("--profile",
+                       action="store", dest="sProfileFile", type = "string",
+                       default="",
+                       help="the JSON file to report the time, records and memory of each stage of the conversion in")
+    oParser.add_option("--profile-dump",
+                       action="store", dest="sProfileDump", type = "string",
+                       default="",
+                       help="with --profile, the file to dump the cProfile stats of the slowest stage in")
+    oParser.add_option("-t", "--test",
+                       action="store_true", dest="bTest",
+                       default=False,
+                       help="run the doctests in this file")
+    return oParser
+
+def default_values(**dValues):
+    """The options of converter.py with their defaults, and the values
+    dValues set on them: the oValues of a Converter made from code.
+    """
+    oValues = make_parser().get_default_values()
+    for sName, oValue in dValues.items():
+        setattr(oValues, sName, oValue)
+    return oValues
+
+# quick and dirty: the strings of each language, that each Converter
+# takes a copy of for its own language, and that are not changed after
 dLang=dict()
 dLang['en']=dict()
 dLang['nl']=dict()
@@ -69,9 +188,6 @@ dLang['en']['ACCOUNT_TYPE_TEMPLATE_NAME']="UK Account Type Chart"
 dLang['nl']['TAX_CODE_TEMPLATE_ID']="tax_code_nl"
 dLang['en']['TAX_CODE_TEMPLATE_ID']="tax_code_uk"
 
-CURRENT_LANG='en'
-def _(sString): return dLang[CURRENT_LANG][sString]
-
 # the original input, used by --test doctest only
 INFILE='charts/account_chart_netherlands.xml'
 
@@ -85,26 +201,354 @@ lTrytonAllowedKinds=['other',
 		  'view',
 		  ]
 
+# How the fields of an OpenERP account.tax.template map to Tryton:
+# (OpenERP field, Tryton field, model searched by code or None to copy the eval)
+lTaxTemplateAccountFields = [
+    ('account_collected_id', 'invoice_account', 'account.account.template'),
+    ('account_paid_id', 'credit_note_account', 'account.account.template'),
+    ]
+# these are only mapped for the percentage taxes, that have both accounts
+lTaxTemplatePercentageFields = [
+    ('base_code_id', 'invoice_base_code', 'account.tax.code.template'),
+    ('tax_code_id', 'invoice_tax_code', 'account.tax.code.template'),
+    ('tax_sign', 'invoice_tax_sign', None),
+    ('base_sign', 'invoice_base_sign', None),
+    ('ref_base_code_id', 'credit_note_base_code', 'account.tax.code.template'),
+    ('ref_tax_code_id', 'credit_note_tax_code', 'account.tax.code.template'),
+    ('ref_base_sign', 'credit_note_base_sign', None),
+    ('ref_tax_sign', 'credit_note_tax_sign', None),
+    ]
+
+# precompiled XPath expressions: the model is passed in as an XPath variable
+dXPath = dict(
+    tryton_record=ET.XPath("/tryton/data/record[@model=$model]"),
+    )
+
+# the search of map_fields, that resolve_refs replaces with a ref
+oSearchByCode = re.compile(r"^\[\('code', '=', '(.*)'\)\]$")
+
+def attrib_shape(tKeys):
+    """The indexes in a flat tuple of attributes (name, value, ...),
+    with the names tKeys, of the values of the ref, search, name and
+    model attributes, or None for each of them that it does not have.
+    """
+    return tuple([tKeys.index(sKey) * 2 + 1 if sKey in tKeys else None
+                  for sKey in ('ref', 'search', 'name', 'model',)])
+
+# the records of the xmlfile files that have been parsed, by path and model:
+# (modification time, size, records,) and the most recently used last
+dSidecarCache = OrderedDict()
+iSidecarCacheSize = 32
+oSidecarLock = threading.Lock()
+
+# the ChartConfigs that have been read, by path and working directory,
+# that the xmlfile files are found from: (modification time, size, config,)
+dConfigCache = OrderedDict()
+
+def resolve_sidecar(sFile, sConfigFile):
+    """The path of an xmlfile file of the config: as it is given,
+    or else relative to the directory of the config file sConfigFile,
+    if there is one. Returns None if it is not found in either place.
+    """
+    if os.path.exists(sFile):
+        return sFile
+    if not sConfigFile:
+        return None
+    sFile = os.path.join(os.path.dirname(sConfigFile), sFile)
+    if os.path.exists(sFile):
+        return sFile
+    return None
+
+def load_sidecar(sFile, sModel):
+    """Return copies of the /tryton/data/record elements of the model
+    sModel in the xmlfile file sFile, with their whitespace.
+    The file is parsed once, and parsed again only when it changes.
+    """
+    try:
+        oStat = os.stat(sFile)
+    except OSError:
+        # it has gone since the config was read
+        assert False, "File not found: "+sFile
+    tKey = (os.path.abspath(sFile), sModel,)
+    with oSidecarLock:
+        t = dSidecarCache.pop(tKey, None)
+        if t is None or t[:2] != (oStat.st_mtime, oStat.st_size,):
+            oSubTree = ET.parse(sFile)
+            t = (oStat.st_mtime, oStat.st_size,
+                 dXPath['tryton_record'](oSubTree, model=sModel),)
+        dSidecarCache[tKey] = t
+        while len(dSidecarCache) > iSidecarCacheSize:
+            dSidecarCache.popitem(last=False)
+        return [copy.deepcopy(e) for e in t[2]]
+
+def field_map(e):
+    """Map the name of each <field> child of the record e to the element,
+    in one pass over the children; the first field of a name wins.
+    """
+    dFields = dict()
+    for oField in e:
+        if oField.tag == 'field':
+            sName = oField.get('name')
+            if sName not in dFields:
+                dFields[sName] = oField
+    return dFields
+
+class ChartConfig(object):
+    """The config of a conversion, read once from the ConfigParser of the
+    config file, and checked, with its xmlfile files found, before any
+    chart is parsed. It can be pickled, to send to other processes.
+    """
+
+    __slots__ = ['sConfigFile',
+                 'a_root_id',
+                 'root_account_template_name',
+                 'root_account_template_id',
+                 'root_account_template_type',
+                 'account_type_income',
+                 'account_type_expense',
+                 'dSidecars',
+                 'dXmlFiles',
+                 ]
+
+    # the options that each section of the config must have
+    lRequired = [('chart', ['a_root_id',
+                            'root_account_template_name',
+                            'root_account_template_id',
+                            'root_account_template_type',]),
+                 ('account.account.template', ['account_type_income',
+                                               'account_type_expense',]),
+                 ]
+    # the sections that can have an xmlfile of records to merge in,
+    # and if the file must be found
+    lSidecars = [('account.tax.group', True),
+                 ('account.tax.rule.template', False),
+                 ('account.tax.rule.line.template', False),
+                 ]
+
+    def __init__(self, oConfig, sConfigFile=None):
+        # sConfigFile is where the xmlfile files are looked for when they
+        # are not found as they are given; a ConfigParser has no file name
+        if sConfigFile is None:
+            sConfigFile = getattr(oConfig, 'sConfigFile', None)
+        self.sConfigFile = sConfigFile
+        for sSection, lOptions in self.lRequired:
+            assert oConfig.has_section(sSection), \
+                "%s not in the sections %r of %s" % (
+                sSection, oConfig.sections(), sConfigFile,)
+            dSection = dict(oConfig.items(sSection))
+            for s in lOptions:
+                assert s in dSection, "%s not in [%s] %r of %s" % (
+                    s, sSection, dSection.keys(), sConfigFile,)
+                setattr(self, s, dSection[s])
+
+        # the absolute path of the xmlfile of each section, or None
+        # if it is not found, and the xmlfile as it is given
+        self.dSidecars = dict()
+        self.dXmlFiles = dict()
+        for sModel, bRequired in self.lSidecars:
+            if not oConfig.has_section(sModel): continue
+            assert oConfig.has_option(sModel, 'xmlfile'), \
+                "xmlfile not in [%s] of %s" % (sModel, sConfigFile,)
+            sGiven = oConfig.get(sModel, 'xmlfile')
+            sFile = resolve_sidecar(sGiven, sConfigFile)
+            assert sFile or not bRequired, "File not found: "+sGiven
+            if sFile:
+                sFile = os.path.abspath(sFile)
+            self.dSidecars[sModel] = sFile
+            self.dXmlFiles[sModel] = sGiven
+
+    @classmethod
+    def read(cls, sConfigFile):
+        """Read and check the config file sConfigFile. It is read once,
+        and read again only when it changes, so that a long running
+        process does not read it for every chart.
+        """
+        assert os.path.exists(sConfigFile), "File not found: "+sConfigFile
+        oStat = os.stat(sConfigFile)
+        tKey = (os.path.abspath(sConfigFile), os.getcwd(),)
+        with oSidecarLock:
+            t = dConfigCache.pop(tKey, None)
+            if t is None or t[:2] != (oStat.st_mtime, oStat.st_size,):
+                oConfig = ConfigParser()
+                oConfig.readfp(open(sConfigFile))
+                t = (oStat.st_mtime, oStat.st_size, cls(oConfig, sConfigFile),)
+            dConfigCache[tKey] = t
+            while len(dConfigCache) > iSidecarCacheSize:
+                dConfigCache.popitem(last=False)
+            return t[2]
+
+    def sidecar(self, sModel):
+        """The absolute path of the xmlfile of the section sModel, or None
+        if it has none. The files that are not required are looked for
+        again each time, as the config is kept while they can come and go.
+        """
+        if sModel not in self.dSidecars:
+            return None
+        if dict(self.lSidecars)[sModel]:
+            return self.dSidecars[sModel]
+        sFile = resolve_sidecar(self.dXmlFiles[sModel], self.sConfigFile)
+        return sFile and os.path.abspath(sFile)
+
+    def lSidecarFiles(self):
+        """The paths of the xmlfile files that are found."""
+        return [sFile for sModel, bRequired in self.lSidecars
+                for sFile in [self.sidecar(sModel)] if sFile]
+
+    def __getstate__(self):
+        return dict([(s, getattr(self, s),) for s in self.__slots__])
+
+    def __setstate__(self, dState):
+        for s, oValue in dState.items():
+            setattr(self, s, oValue)
+
 class Converter(object):
     """
     """
 
-    def __init__(self, infile, oConfig=None, oValues=None):
+    # the OpenERP models that are read from the input, in output order,
+    # and the stage that converts each of their records
+    lInputStages = [
+        ('account.account.type', 'account_type_template'),
+        ('account.account.template', 'account_template'),
+        ('account.tax.code.template', 'tax_code_template'),
+        ('account.tax.template', 'tax_template'),
+    ]
+
+    # the stages of the output, in order: the records of the
+    # lAccountStages are the chart of accounts, the others the chart of taxes
+    lOutputStages = ['account_type_template',
+                     'account_template',
+                     'tax_code_template',
+                     'tax_group',
+                     'tax_template',
+                     'tax_rule_template',
+                     'tax_rule_line_template',
+                     ]
+    lAccountStages = lOutputStages[:2]
+
+    # the config attributes and the language strings that the records of
+    # each of the lOutputStages depend on, besides the input: converters
+    # that convert_from the same input share the records of a stage
+    # if these are the same for them, and build them only once.
+    # The stages of the xmlfile files are cheap, and not shared.
+    dStageDepends = dict(
+        account_type_template=([], ['ACCOUNT_TYPE_TEMPLATE_NAME',
+                                    'ACCOUNT_TYPE_TEMPLATE_ID',]),
+        account_template=(['a_root_id',
+                           'root_account_template_name',
+                           'root_account_template_id',
+                           'root_account_template_type',
+                           'account_type_income',
+                           'account_type_expense',], []),
+        tax_code_template=(['root_account_template_id',],
+                           ['TAX_CODE_TEMPLATE_ID',]),
+        tax_template=(['root_account_template_id',], []),
+        )
+
+    def __init__(self, infile=None, oConfig=None, oValues=None, lHooks=(),
+                 sLang=None):
+        """Set up a converter with the config oConfig (a ChartConfig,
+        a ConfigParser or the name of a config file), and convert infile
+        into self.outtree and self.taxtree, if it is given. Without an
+        infile, nothing is read: use iter_records or convert later.
+        Without a config, the converter can only parse an input,
+        for other converters to convert_from.
+        The language sLang defaults to the --lang of oValues, or en.
+        """
+        if sLang is None:
+            sLang = getattr(oValues, 'sLang', None) or 'en'
+        assert sLang in dLang, "%s not in dLang %r" % (sLang, sorted(dLang),)
+        self.sLang = sLang
+        # this converter's own copy, so that converters of other
+        # languages can run at the same time
+        self.dLang = dict(dLang[sLang])
+        if isinstance(oConfig, basestring):
+            oConfig = ChartConfig.read(oConfig)
+        elif oConfig is not None and not isinstance(oConfig, ChartConfig):
+            oConfig = ChartConfig(oConfig)
         self.oConfig = oConfig
         self.oValues = oValues
-
-        self.intree = ET.parse(infile)
-        self.maker = ElementMaker()
+        # the objects whose before_stage and after_stage methods
+        # are called around each stage of the conversion
+        self.lHooks = list(lHooks)
+
+        # makes the ir Records and Fields of the output, and with
+        # --validate counts what validate checks of them as it does
+        self.maker = ir.Maker(
+            bChecked=bool(oValues and getattr(oValues, 'bValidate', False)))
+        self.intree = None
+        self.dRecordIndex = OrderedDict()
+        # the field_map of each input record, kept by parse for all of
+        # the converters that convert_from it, or None to not keep them
+        self.dFieldMaps = None
+        # the records built for each stage key by the converters that
+        # convert_from this one's input
+        self.dStageRecords = dict()
+        self.outtree = None
+        self.taxtree = None
+        if infile is not None:
+            self.convert(infile)
+
+    def convert(self, infile):
+        """Convert infile into the <tryton> trees self.outtree, and
+        self.taxtree if there is a --taxfile (or else it is None).
+        """
+        oValues = self.oValues
+        # a pool process builds the two charts one after the other
+        if not self.streams(infile) and \
+               oValues and getattr(oValues, 'bParallel', False) and \
+               not in_daemon_process():
+            self.intree = self.stage('parse', self.parse_input, infile)
+            self.dRecordIndex = self.stage('index', self.index_records,
+                                           self.intree)
+            (tree, lTaxTree,) = self.stage('build_parallel',
+                                           self.build_parallel)
+            tree = self.stage('sort_parents_first', sort_parents_first, tree)
+            lTaxTree = self.stage('sort_parents_first', sort_parents_first,
+                                  lTaxTree)
+        else:
+            tree = []
+            lTaxTree = []
+            for (sStage, lRecords,) in self.iter_stages(infile):
+                if sStage in self.lAccountStages:
+                    tree += lRecords
+                else:
+                    lTaxTree += lRecords
+        self.make_trees(tree, lTaxTree)
+
+    def convert_from(self, oInput):
+        """Convert the input that the converter oInput has parsed and
+        indexed, sharing its index and field maps instead of parsing it
+        again, into self.outtree and self.taxtree, as convert does.
+        The records of a stage that another converter has already built
+        from oInput, with the same stage_key, are copied, not built again.
+        """
+        self.intree = oInput.intree
+        self.dRecordIndex = oInput.dRecordIndex
+        self.dFieldMaps = oInput.dFieldMaps
         tree = []
-        tree += self.build_account_type_template()
-        tree += self.build_account_template()
         lTaxTree = []
-        lTaxTree += self.build_tax_code_template()
-        lTaxTree += self.build_tax_group()
-        lTaxTree += self.build_tax_template()
-        lTaxTree += self.build_tax_rule_template()
-        lTaxTree += self.build_tax_rule_line_template()
-
+        for sStage in self.lOutputStages:
+            tKey = self.stage_key(sStage)
+            oShared = oInput.dStageRecords.get(tKey)
+            if oShared is None:
+                lRecords = self.build_stage(sStage)
+                if tKey is not None:
+                    oShared = oInput.dStageRecords[tKey] = lRecords
+            if oShared is not None:
+                lRecords = self.stage('copy_'+sStage, copy_records, oShared)
+            if sStage in self.lAccountStages:
+                tree += lRecords
+            else:
+                lTaxTree += lRecords
+        self.make_trees(tree, lTaxTree)
+
+    def make_trees(self, tree, lTaxTree):
+        """Make the <tryton> trees of the records of the chart of accounts
+        tree and of the chart of taxes lTaxTree: self.outtree, and
+        self.taxtree if there is a --taxfile, or else it is None.
+        """
+        oValues = self.oValues
         if oValues and oValues.sTaxfile:
             tree = tuple(tree)
             self.outtree = self.maker.tryton(self.maker.data(*tree))
@@ -115,191 +559,549 @@ class Converter(object):
             self.outtree = self.maker.tryton(self.maker.data(*tree))
             self.taxtree = None
 
+    def iter_records(self, infile):
+        """Yield the converted records of infile one at a time, in output
+        order, without building the output trees. Only the records of
+        one of the lOutputStages are built at a time, unless the input
+        is streamed, when they are all built in the one pass over it.
+        """
+        for (sStage, lRecords,) in self.iter_stages(infile):
+            for e in lRecords:
+                yield e
+
+    def iter_stages(self, infile, oSpool=None):
+        """Yield (stage, list of records,) for each of the lOutputStages
+        in turn, converted from infile, with the parents first.
+        If the input is streamed and oSpool is a RecordSpool, the records
+        that it converts are written to it as they are made, and what is
+        yielded for their stages are the bytes of the records instead.
+        """
+        if self.streams(infile):
+            # dont keep the input document: convert each record as it is
+            # parsed, and throw it away once it is used
+            self.intree = None
+            self.dRecordIndex = OrderedDict()
+            if is_xml_bytes(infile):
+                from StringIO import StringIO
+                infile = StringIO(bytes(infile))
+            dStages = self.stage('stream_input', self.stream_input, infile,
+                                 oSpool)
+        else:
+            self.intree = self.stage('parse', self.parse_input, infile)
+            self.dRecordIndex = self.stage('index', self.index_records,
+                                           self.intree)
+            dStages = dict()
+            oSpool = None
+        return self.build_stages(dStages, oSpool)
+
+    def build_stages(self, dStages=None, oSpool=None):
+        """Yield (stage, list of records,) for each of the lOutputStages
+        in turn, from the records already converted for each stage in
+        dStages, or else built from the indexed input, with the parents first.
+        The records of dStages that are in the RecordSpool oSpool are
+        read back from it as bytes.
+        """
+        for sStage in self.lOutputStages:
+            if dStages and sStage in dStages:
+                lRecords = self.stage('sort_parents_first', sort_parents_first,
+                                      dStages.pop(sStage))
+                if oSpool is not None:
+                    lRecords = oSpool.read(lRecords)
+                yield (sStage, lRecords,)
+            else:
+                yield (sStage, self.build_stage(sStage),)
+
+    def build_stage(self, sStage):
+        """Build the records of the stage sStage from the indexed input,
+        with the parents first.
+        """
+        lRecords = self.stage('build_'+sStage, getattr(self, 'build_'+sStage))
+        return self.stage('sort_parents_first', sort_parents_first, lRecords)
+
+    def stage_key(self, sStage):
+        """The key of the records of the stage sStage among the converters
+        of the same input: the stage, and the values of the config and
+        language that its records depend on, or None if it is not shared.
+        """
+        if sStage not in self.dStageDepends:
+            return None
+        (lConfig, lLang,) = self.dStageDepends[sStage]
+        return (sStage,) + \
+               tuple([getattr(self.oConfig, s) for s in lConfig]) + \
+               tuple([self._(s) for s in lLang])
+
+    def streams(self, infile):
+        """Whether infile is converted as it is parsed: with --stream,
+        unless it is already parsed, or if it is a directory of CSV files.
+        """
+        if isinstance(infile, (ET._ElementTree, ET._Element,)):
+            return False
+        if is_xml_bytes(infile):
+            return bool(self.oValues and getattr(self.oValues, 'bStream', False))
+        if isinstance(infile, basestring) and os.path.isdir(infile):
+            return True
+        return bool(self.oValues and getattr(self.oValues, 'bStream', False))
+
+    def parse_input(self, infile):
+        """Parse infile, which can be the name of a file, the bytes of
+        an XML document, a file-like object, or an already parsed lxml
+        tree or element, and return its ElementTree.
+        """
+        if isinstance(infile, ET._ElementTree):
+            return infile
+        if isinstance(infile, ET._Element):
+            return infile.getroottree()
+        if is_xml_bytes(infile):
+            return ET.ElementTree(ET.fromstring(bytes(infile)))
+        return ET.parse(infile)
+
+    def parse(self, infile):
+        """Parse and index infile, without converting it, and keep the
+        field map of each record, for other converters to convert_from:
+        the input is read once for all of them. A directory of CSV files
+        is indexed from the records that csvchart reads from it.
+        """
+        if isinstance(infile, basestring) and os.path.isdir(infile):
+            self.intree = None
+            self.dRecordIndex = self.stage('index', self.index_csv, infile)
+        else:
+            self.intree = self.stage('parse', self.parse_input, infile)
+            self.dRecordIndex = self.stage('index', self.index_records,
+                                           self.intree)
+        self.dFieldMaps = dict()
+        self.dStageRecords = dict()
+
+    def field_map(self, e):
+        """The field_map of the input record e, kept in self.dFieldMaps
+        if the input is shared with other converters.
+        """
+        if self.dFieldMaps is None:
+            return field_map(e)
+        dFields = self.dFieldMaps.get(e)
+        if dFields is None:
+            dFields = self.dFieldMaps[e] = field_map(e)
+        return dFields
+
+    def _(self, sString):
+        """The string sString in the language of this converter."""
+        return self.dLang[sString]
+
+    def stage(self, sName, fStage, *lArgs):
+        """Return fStage(*lArgs), calling the before_stage and after_stage
+        methods of the hooks around it, with the name of the stage sName.
+        """
+        if not self.lHooks:
+            return fStage(*lArgs)
+        for oHook in self.lHooks:
+            oHook.before_stage(self, sName)
+        oResult = fStage(*lArgs)
+        for oHook in reversed(self.lHooks):
+            oHook.after_stage(self, sName, oResult)
+        return oResult
+
+    def build_account_tree(self):
+        """Build the records of the chart of accounts."""
+        tree = []
+        tree += self.stage('build_account_type_template',
+                           self.build_account_type_template)
+        tree += self.stage('build_account_template',
+                           self.build_account_template)
+        return tree
+
+    def build_tax_tree(self):
+        """Build the records of the chart of taxes, that do not depend
+        on the records of the chart of accounts.
+        """
+        lTaxTree = []
+        lTaxTree += self.stage('build_tax_code_template',
+                               self.build_tax_code_template)
+        lTaxTree += self.stage('build_tax_group', self.build_tax_group)
+        lTaxTree += self.stage('build_tax_template', self.build_tax_template)
+        lTaxTree += self.stage('build_tax_rule_template',
+                               self.build_tax_rule_template)
+        lTaxTree += self.stage('build_tax_rule_line_template',
+                               self.build_tax_rule_line_template)
+        return lTaxTree
+
+    def build_parallel(self):
+        """Build the chart of taxes in a forked process while this one
+        builds the chart of accounts, and return both lists of records.
+        The tax records come back over a pipe, pickled.
+        """
+        import multiprocessing
+        (oReader, oWriter,) = multiprocessing.Pipe(duplex=False)
+        oProcess = multiprocessing.Process(target=self.build_tax_child,
+                                           args=(oWriter,))
+        oProcess.start()
+        oWriter.close()
+        try:
+            tree = self.build_account_tree()
+        finally:
+            (oError, lSent, lReports,) = oReader.recv()
+            oProcess.join()
+        if oError is not None:
+            raise oError
+        # the hooks that measure the stages of the child take its measures
+        for (oHook, oReport,) in zip(self.lHooks, lReports):
+            if hasattr(oHook, 'merge_child'):
+                oHook.merge_child(oReport)
+        lTaxTree = []
+        for e in lSent:
+            if isinstance(e, tuple):
+                (sXml, sTail,) = e
+                e = ET.fromstring(sXml)
+                e.tail = sTail
+            lTaxTree.append(e)
+        return (tree, lTaxTree,)
+
+    def build_tax_child(self, oWriter):
+        for oHook in self.lHooks:
+            if hasattr(oHook, 'start_child'):
+                oHook.start_child()
+        try:
+            # the lxml records of the xmlfile files do not pickle:
+            # they are sent as XML, and their whitespace after them
+            lSent = [e if isinstance(e, ir.Record) else
+                     (ET.tostring(e, with_tail=False), e.tail,)
+                     for e in self.build_tax_tree()]
+        except Exception, e:
+            (type, value, traceback,) = sys.exc_info()
+            try:
+                oWriter.send((value, None, None,))
+            except Exception:
+                oWriter.send((RuntimeError("%s: %s" % (type.__name__, value,)),
+                              None, None,))
+        else:
+            lReports = [oHook.child_report() if hasattr(oHook, 'child_report')
+                        else None for oHook in self.lHooks]
+            oWriter.send((None, lSent, lReports,))
+        oWriter.close()
+
+    def index_records(self, oTree):
+        """Group the /openerp/data/record elements of oTree by model,
+        in one pass over the document, keeping them in document order.
+        """
+        dIndex = OrderedDict()
+        oRoot = oTree.getroot()
+        if oRoot.tag != 'openerp':
+            return dIndex
+        for oData in oRoot:
+            if oData.tag != 'data':
+                continue
+            for e in oData:
+                if e.tag != 'record':
+                    continue
+                sModel = e.get('model')
+                if sModel not in dIndex:
+                    dIndex[sModel] = []
+                dIndex[sModel].append(e)
+        return dIndex
+
+    def index_csv(self, sDir):
+        """Group the records that csvchart reads from the CSV files of
+        the directory sDir by model, as index_records does.
+        """
+        import csvchart
+        dIndex = OrderedDict()
+        for e in csvchart.iter_records(sDir):
+            sModel = e.get('model')
+            if sModel not in dIndex:
+                dIndex[sModel] = []
+            dIndex[sModel].append(e)
+        return dIndex
+
+    def records(self, sModel):
+        """The input records of the model sModel, in document order."""
+        return self.dRecordIndex.get(sModel, [])
+
+    def stream_input(self, infile, oSpool=None):
+        """Convert the /openerp/data/record elements of infile as they
+        are parsed, and clear every element once it is used,
+        so that the memory used does not grow with the size of the input.
+        If infile is the directory of the CSV files of an OpenERP chart,
+        its records are read from the CSV files by csvchart instead.
+        Returns a dictionary of the converted records for each stage,
+        that are SpooledRecords if they are written to the RecordSpool
+        oSpool, as convert_records does.
+        """
+        if isinstance(infile, basestring) and os.path.isdir(infile):
+            import csvchart
+            return self.convert_records(csvchart.iter_records(infile), oSpool)
+        return self.convert_records(self.iter_input(infile), oSpool)
+
+    def iter_input(self, infile):
+        """Yield the /openerp/data/record elements of infile as they are
+        parsed, and clear each one after it has been used.
+        """
+        for (sEvent, e) in ET.iterparse(infile, events=('end',), tag='record'):
+            oData = e.getparent()
+            if oData is not None and oData.tag == 'data' and \
+                   oData.getparent() is not None and \
+                   oData.getparent().tag == 'openerp' and \
+                   oData.getparent().getparent() is None:
+                yield e
+            e.clear()
+            # the comments and records before this one are finished with too
+            oParent = e.getparent()
+            if oParent is not None:
+                while e.getprevious() is not None:
+                    del oParent[0]
+
+    def convert_records(self, lRecords, oSpool=None):
+        """Convert the OpenERP records from the iterable lRecords in order,
+        using the start_* and record_* methods of each of the lInputStages.
+        Returns a dictionary of the converted records for each stage,
+        after the finish_* method of the stage, if it has one.
+        With a RecordSpool oSpool, the records are written to it as they
+        are made, and only their SpooledRecords are kept.
+        """
+        dStages = dict()
+        dHandlers = dict()
+        for sModel, sStage in self.lInputStages:
+            dStages[sStage] = getattr(self, 'start_'+sStage)()
+            if oSpool is not None:
+                dStages[sStage] = SpooledList(
+                    oSpool, dStages[sStage],
+                    bHoldOrphans=hasattr(self, 'finish_'+sStage))
+            dHandlers[sModel] = (dStages[sStage],
+                                 getattr(self, 'record_'+sStage),)
+
+        for e in lRecords:
+            t = dHandlers.get(e.get('model'))
+            if t:
+                oRecord = t[1](e)
+                if oRecord is not None:
+                    t[0].append(oRecord)
+        for sModel, sStage in self.lInputStages:
+            if hasattr(self, 'finish_'+sStage):
+                getattr(self, 'finish_'+sStage)(dStages[sStage])
+        return dStages
+
     def build_account_type_template(self):
         # account.account.type -> account.account.type.template
+        r = self.start_account_type_template()
+        for e in self.records('account.account.type'):
+            r.append(self.record_account_type_template(e))
+        return r
+
+    def start_account_type_template(self):
         m = self.maker
         r = []
-        seq = 10
+        self.iAccountTypeSeq = 10
         r.append(
             m.record(
-                m.field(_('ACCOUNT_TYPE_TEMPLATE_NAME'), name='name'),
+                m.field(self._('ACCOUNT_TYPE_TEMPLATE_NAME'), name='name'),
                 m.field(name="sequence", eval="10"),
                 model='account.account.type.template',
-                id=_('ACCOUNT_TYPE_TEMPLATE_ID'),
+                id=self._('ACCOUNT_TYPE_TEMPLATE_ID'),
             )
         )
-        for e in self.intree.xpath("/openerp/data/record[@model='account.account.type']"):
-            f = []
-            id = e.get("id")
-            name = e.xpath("field[@name='name']")[0].text
-            ## you can have account.account.type id="account_type_view"
-            ## where the close_method is not required
-            l = e.xpath("field[@name='close_method']")
-            if l:
-                closemethod = l[0].text
-            else:
-                closemethod = ''
-            f.append(m.field(name, name='name'))
-            f.append(m.field(name='sequence', eval=str(seq)))
-            f.append(m.field(name='parent', ref=_('ACCOUNT_TYPE_TEMPLATE_ID')))
-            if closemethod == 'balance':
-                f.append(m.field(name='balance_sheet', eval="True"))
-            f = tuple(f)
-            seq += 10
-            r.append(m.record(*f, model='account.account.type.template', id=id))
         return r
 
+    def record_account_type_template(self, e):
+        m = self.maker
+        f = []
+        id = e.get("id")
+        dFields = self.field_map(e)
+        name = dFields['name'].text
+        ## you can have account.account.type id="account_type_view"
+        ## where the close_method is not required
+        l = dFields.get('close_method')
+        if l is not None:
+            closemethod = l.text
+        else:
+            closemethod = ''
+        f.append(m.field(name, name='name'))
+        f.append(m.field(name='sequence', eval=str(self.iAccountTypeSeq)))
+        f.append(m.field(name='parent', ref=self._('ACCOUNT_TYPE_TEMPLATE_ID')))
+        if closemethod == 'balance':
+            f.append(m.field(name='balance_sheet', eval="True"))
+        f = tuple(f)
+        self.iAccountTypeSeq += 10
+        return m.record(*f, model='account.account.type.template', id=id)
+
 
     def build_account_template(self):
         # account.account.template
-        assert 'account.account.template' in self.oConfig.sections()
-        dChartConfig=dict(self.oConfig.items('chart'))
-        for s in ['a_root_id', 'root_account_template_name']:
-            assert s in dChartConfig, "%s not in dChartConfig %r" \
-                % (s, dChartConfig.keys(),)
-        dAccountAccountTemplate=dict(self.oConfig.items('account.account.template'))
-        for s in ['account_type_income', 'account_type_expense']:
-            assert s in dAccountAccountTemplate, "%s not in dAccountAccountTemplate %r" \
-                % (s, dAccountAccountTemplate.keys(),)
+        r = self.start_account_template()
+        l = self.records('account.account.template')
+        for e in l:
+            oRecord = self.record_account_template(e)
+            if oRecord is not None:
+                r.append(oRecord)
+        return r
+
+    def start_account_template(self):
+        oConfig = self.oConfig
         m = self.maker
         r = []
         r.append(
             m.record(
-                m.field(dChartConfig['root_account_template_name'], name="name"),
+                m.field(oConfig.root_account_template_name, name="name"),
                 m.field("view", name="kind"),
-                m.field(name="type", ref=dChartConfig['root_account_template_type']),
-                m.field(dChartConfig['root_account_template_id'], name="code"),
-                id=dChartConfig['root_account_template_id'],
+                m.field(name="type", ref=oConfig.root_account_template_type),
+                m.field(oConfig.root_account_template_id, name="code"),
+                id=oConfig.root_account_template_id,
                 model="account.account.template",
             )
         )
-        l = self.intree.xpath("/openerp/data/record[@model='account.account.template']")
-        for e in l:
-            id = e.get("id")
-            if id == dChartConfig['a_root_id']:
-                continue
-            name = e.xpath("field[@name='name']")[0].text
-            code = e.xpath("field[@name='code']")[0].text
-            kind = e.xpath("field[@name='type']")[0].text
-            user_type = e.xpath("field[@name='user_type']")
-            reconcile = e.xpath("field[@name='reconcile']")
-            parent = e.xpath("field[@name='parent_id']")
-                
-            f = []
-            f.append(m.field(name, name='name'))
-            f.append(m.field(code, name='code'))
-            ref = None
-            if user_type:
-                ref = user_type[0].get("ref")
-                f.append(m.field(name='type',ref=ref))
-
-            # These names are only conventional in Oerp
-            if ref == dAccountAccountTemplate['account_type_income']:
-                kind = 'revenue'
-            elif ref == dAccountAccountTemplate['account_type_expense']:
-                #? what about COGS - is it kind=other and type=expense?
-                #?if kind != 'other':
-                kind = 'expense'
-            elif ref == "account_type_output_tax":
-                #? liability
-                kind = "other"
-                #? "Unreconciled" why not balance?
-            elif ref == "account_type_input_tax":
-                #? asset
-                kind = "other"
-                #? "Unreconciled" why not balance?
-
-            ##? liquidity kind does not exist in Tryton - use other?
-            if kind == 'liquidity': kind = 'other'
-
-            ##? stock kind does not exist in Oerp - use other?
-            if kind != 'view' and name.lower().startswith('stock'):
-                # FixMe: this is gross
-                kind = 'stock'
-
-            assert kind in lTrytonAllowedKinds, \
-                "%s not in lTrytonAllowedKinds %r" % (kind, lTrytonAllowedKinds,)
-            f.append(m.field(kind, name='kind'))
-
-            if reconcile:
-                reconcile = str(eval(reconcile[0].get("eval")))
-                f.append(m.field(name='reconcile', eval=reconcile))
-
-            if parent:
-                parent = parent[0].get("ref")
-                if parent == dChartConfig['a_root_id']:
-                    parent = dChartConfig['root_account_template_id']
-            else:
-                # should only be one of these
-                parent=dChartConfig['root_account_template_id']
-            f.append(m.field(name='parent', ref=parent))
-            
-            f = tuple(f)
-            r.append(m.record(*f, model='account.account.template', id=id))
         return r
 
-    def build_tax_code_template(self):
-        dChartConfig=dict(self.oConfig.items('chart'))
-        for s in ['root_account_template_id']:
-            assert s in dChartConfig, "%s not in dChartConfig %r" \
-                % (s, dChartConfig.keys(),)
-
-        l = self.intree.xpath("/openerp/data/record[@model='account.tax.code.template']")
+    def record_account_template(self, e):
+        oConfig = self.oConfig
         m = self.maker
-        r = []
-        origroot = None
+        id = e.get("id")
+        if id == oConfig.a_root_id:
+            return None
+        dFields = self.field_map(e)
+        name = dFields['name'].text
+        code = dFields['code'].text
+        kind = dFields['type'].text
+        user_type = dFields.get('user_type')
+        reconcile = dFields.get('reconcile')
+        parent = dFields.get('parent_id')
+
+        f = []
+        f.append(m.field(name, name='name'))
+        f.append(m.field(code, name='code'))
+        ref = None
+        if user_type is not None:
+            ref = user_type.get("ref")
+            f.append(m.field(name='type',ref=ref))
+
+        # These names are only conventional in Oerp
+        if ref == oConfig.account_type_income:
+            kind = 'revenue'
+        elif ref == oConfig.account_type_expense:
+            #? what about COGS - is it kind=other and type=expense?
+            #?if kind != 'other':
+            kind = 'expense'
+        elif ref == "account_type_output_tax":
+            #? liability
+            kind = "other"
+            #? "Unreconciled" why not balance?
+        elif ref == "account_type_input_tax":
+            #? asset
+            kind = "other"
+            #? "Unreconciled" why not balance?
+
+        ##? liquidity kind does not exist in Tryton - use other?
+        if kind == 'liquidity': kind = 'other'
+
+        ##? stock kind does not exist in Oerp - use other?
+        if kind != 'view' and name.lower().startswith('stock'):
+            # FixMe: this is gross
+            kind = 'stock'
+
+        assert kind in lTrytonAllowedKinds, \
+            "%s not in lTrytonAllowedKinds %r" % (kind, lTrytonAllowedKinds,)
+        f.append(m.field(kind, name='kind'))
+
+        if reconcile is not None:
+            reconcile = str(literals.literal(reconcile.get("eval"), id))
+            f.append(m.field(name='reconcile', eval=reconcile))
+
+        if parent is not None:
+            parent = parent.get("ref")
+            if parent == oConfig.a_root_id:
+                parent = oConfig.root_account_template_id
+        else:
+            # should only be one of these
+            parent=oConfig.root_account_template_id
+        f.append(m.field(name='parent', ref=parent))
+
+        f = tuple(f)
+        return m.record(*f, model='account.account.template', id=id)
+
+    def build_tax_code_template(self):
+        r = self.start_tax_code_template()
+        l = self.records('account.tax.code.template')
         for e in l:
-            f = []
-            id = e.get("id")
-            name = e.xpath("field[@name='name']")[0].text
-            assert name, "Null name in account.tax.code.template for id="+id+' '+repr(e.text)
-            code = e.xpath("field[@name='code']")
-            parent = e.xpath("field[@name='parent_id']")
-            # was if not parent:  continue
-            if not parent or (parent[0].get("eval") and 
-                               not eval(parent[0].get("eval"))):
-                origroot=id
-                code = code[0].text
-                r.append(
-                    m.record(
-                        m.field(name, name='name'),
-                        m.field(code, name='code'),
-                        m.field(name='account', ref=dChartConfig['root_account_template_id']),
-                        model="account.tax.code.template",
-                        id=_('TAX_CODE_TEMPLATE_ID')
-                    )
-                )
+            r.append(self.record_tax_code_template(e))
+        self.finish_tax_code_template(r)
+        return r
+
+    def start_tax_code_template(self):
+        self.sTaxCodeOrigRoot = None
+        return []
+
+    def finish_tax_code_template(self, r):
+        """Point the tax codes that came before the root of the tax codes
+        at its new id, now that the id it had is known."""
+        sRoot = self.sTaxCodeOrigRoot
+        if sRoot is None:
+            return
+        for e in r:
+            # the SpooledRecords were written after their parent
+            if type(e) is not ir.Record or parent_ref(e) != sRoot:
                 continue
+            for oField in e.lFields:
+                if oField.get('name') == 'parent':
+                    tAttrib = oField.tAttrib
+                    i = tAttrib.index('ref') + 1
+                    self.replace_field(e, oField, ir.Field(
+                        tAttrib[:i] + (self._('TAX_CODE_TEMPLATE_ID'),) +
+                        tAttrib[i+1:]))
+                    break
+
+    def replace_field(self, e, oField, oNew):
+        """Put the Field oNew, that is not made by the maker, in the place
+        of oField in the ir Record e, and in the Checks the maker counts.
+        """
+        # the Fields of a record may be shared by its copies
+        e.lFields[e.lFields.index(oField)] = oNew
+        oChecks = self.maker.oChecks
+        if oChecks is not None and e in oChecks.dRecords:
+            for (oCounted, iCount,) in [(oField, -1,), (oNew, 1,)]:
+                tCheck = ir.field_check(oCounted)
+                if tCheck is not None:
+                    oChecks.add(e.sModel, tCheck, iCount)
+
+    def record_tax_code_template(self, e):
+        oConfig = self.oConfig
+        m = self.maker
+        f = []
+        id = e.get("id")
+        dFields = self.field_map(e)
+        name = dFields['name'].text
+        assert name, "Null name in account.tax.code.template for id="+id+' '+repr(e.text)
+        code = dFields.get('code')
+        parent = dFields.get('parent_id')
+        # was if not parent:  continue
+        if parent is None or (parent.get("eval") and
+                              not literals.literal(parent.get("eval"), id)):
+            self.sTaxCodeOrigRoot = id
+            code = code.text
+            return m.record(
+                m.field(name, name='name'),
+                m.field(code, name='code'),
+                m.field(name='account', ref=oConfig.root_account_template_id),
+                model="account.tax.code.template",
+                id=self._('TAX_CODE_TEMPLATE_ID')
+            )
 
-            f.append(m.field(name, name='name'))
-            f.append(m.field(name='account',
-                             ref=dChartConfig['root_account_template_id']))
-
-            parent = parent[0].get("ref")
-            if parent == origroot:
-                parent = _('TAX_CODE_TEMPLATE_ID')
-            f.append(m.field(name='parent', ref=parent))
-
-            if code:
-                code = code[0].text
-                f.append(m.field(code, name='code'))
-            #? "notprintable","sign"
-            f = tuple(f)
-            r.append(m.record(*f, model='account.tax.code.template', id=id))
+        f.append(m.field(name, name='name'))
+        f.append(m.field(name='account',
+                         ref=oConfig.root_account_template_id))
 
-        return r
+        parent = parent.get("ref")
+        if parent == self.sTaxCodeOrigRoot:
+            parent = self._('TAX_CODE_TEMPLATE_ID')
+        f.append(m.field(name='parent', ref=parent))
+
+        if code is not None:
+            code = code.text
+            f.append(m.field(code, name='code'))
+        #? "notprintable","sign"
+        f = tuple(f)
+        return m.record(*f, model='account.tax.code.template', id=id)
 
     def build_tax_group(self):
         model="account.tax.group"
-        if not self.oConfig.has_section(model): return []
-
-        dTaxGroup=dict(self.oConfig.items(model))
-        sFile=dTaxGroup['xmlfile']
-        # print sFile
-        assert os.path.exists(sFile), "File not found: "+sFile
-        oSubTree=ET.parse(sFile)
+        sFile = self.oConfig.sidecar(model)
+        if not sFile: return []
 
-        l = oSubTree.xpath("/tryton/data/record[@model='%s']" % model)
+        l = load_sidecar(sFile, model)
         # ??
         return l
     
@@ -321,170 +1123,115 @@ class Converter(object):
         return r
 
     def build_tax_template(self):
-        dChartConfig=dict(self.oConfig.items('chart'))
         model="account.tax.template"
-        l = self.intree.xpath("/openerp/data/record[@model='%s']" % model)
-        m = self.maker
-        r = []
+        r = self.start_tax_template()
+        l = self.records(model)
         for e in l:
-            f = []
-            id = e.get("id")
-            name               = e.xpath("field[@name='name']")[0].text
-            f.append(m.field(name, name='name'))
-            try:
-                description        = e.xpath("field[@name='description']")
-                if description:
-                    description = description[0].text
-                    f.append(m.field(description, name='description'))
-                else:
-                    f.append(m.field(name, name='description'))
-                account_collected  = e.xpath("field[@name='account_collected_id']")
-                if account_collected:
-                    account_collected = account_collected[0].get("ref")
-                    f.append(
-                        m.field(search="[('code', '=', '%s')]" % \
-                                (account_collected,),
-                                model='account.account.template',
-                                name='invoice_account',
-                        )
-                    )
+            r.append(self.record_tax_template(e))
+        return r
+
+    def start_tax_template(self):
+        return []
 
-                account_paid       = e.xpath("field[@name='account_paid_id']")
-                if account_paid:
-                    account_paid = account_paid[0].get("ref")
+    def record_tax_template(self, e):
+        oConfig = self.oConfig
+        model="account.tax.template"
+        m = self.maker
+        f = []
+        id = e.get("id")
+        dFields = self.field_map(e)
+        name = dFields['name'].text
+        f.append(m.field(name, name='name'))
+        try:
+            description = dFields.get('description')
+            if description is not None:
+                f.append(m.field(description.text, name='description'))
+            else:
+                f.append(m.field(name, name='description'))
+            f += self.map_fields(dFields, lTaxTemplateAccountFields)
+
+            # a tax with both accounts is a percentage, as it always
+            # was: a field with an empty ref counts as no account
+            oCollected = dFields.get('account_collected_id')
+            oPaid = dFields.get('account_paid_id')
+            if oCollected is not None and oCollected.get('ref') and \
+                   oPaid is not None and oPaid.get('ref'):
+                amount = dFields.get('amount')
+                if amount is not None:
+                    if 'eval' in amount.keys():
+                        g = amount.get("eval")
+                    else:
+                        g = amount.text
+                    amount = float(literals.number(g))
                     f.append(
                         m.field(
-                            search="[('code', '=', '%s')]" % \
-                                                 (account_paid,),
-                            model='account.account.template',
-                            name='credit_note_account',
+                            name='rate',
+                            eval="Decimal('%2.2f')" % amount,
                         )
                     )
-
-                if account_collected and account_paid:
-
-                    amount             = e.xpath("field[@name='amount']")
-                    if amount:
-                        if 'eval' in amount[0].keys():
-                            g = amount[0].get("eval")
-                        else:
-                            g = amount[0].text
-                        amount = float(g)
-                        f.append(
-                            m.field(
-                                name='rate',
-                                eval="Decimal('%2.2f')" % amount,
-                            )
-                        )
-                        f.append(m.field('percentage', name='type'))
-
-                    base_code = e.xpath("field[@name='base_code_id']")
-                    if base_code:
-                        base_code = base_code[0].get("ref")
-                        f.append(m.field(search="[('code', '=', '%s')]" % \
-                                                 (base_code,),
-                                         model='account.tax.code.template',
-                                         name='invoice_base_code',
-                                     )
-                        )
-                    tax_code           = e.xpath("field[@name='tax_code_id']")
-                    if tax_code:
-                        tax_code = tax_code[0].get("ref")
-                        f.append(m.field(search="[('code', '=', '%s')]" % \
-                                                 (tax_code,),
-                                         model='account.tax.code.template',
-                                         name='invoice_tax_code',
-                                     )
-                        )
-
-                    tax_sign = e.xpath("field[@name='tax_sign']")
-                    if tax_sign:
-                        tax_sign = tax_sign[0].get("eval")
-                        f.append(m.field(name='invoice_tax_sign', eval=tax_sign))
-
-                    base_sign          = e.xpath("field[@name='base_sign']")
-                    if base_sign:
-                        base_sign = base_sign[0].get("eval")
-                        f.append(m.field(name='invoice_base_sign', eval=base_sign))
-
-                    ref_base_code = e.xpath("field[@name='ref_base_code_id']")
-                    if base_code:
-                        ref_base_code = ref_base_code[0].get("ref")
-                        f.append(m.field(search="[('code', '=', '%s')]" % \
-                                                 (ref_base_code,),
-                                         model='account.tax.code.template',
-                                         name='credit_note_base_code',
-                                     )
-                        )
-                    ref_tax_code       = e.xpath("field[@name='ref_tax_code_id']")
-                    if ref_tax_code:
-                        ref_tax_code = ref_tax_code[0].get("ref")
-                        f.append(m.field(search="[('code', '=', '%s')]" % \
-                                                 (ref_tax_code,),
-                                         model='account.tax.code.template',
-                                         name='credit_note_tax_code',
-                                     )
-                        )
-
-                    ref_base_sign = e.xpath("field[@name='ref_base_sign']")
-                    if ref_base_sign:
-                        ref_base_sign = ref_base_sign[0].get("eval")
-                        f.append(m.field(name='credit_note_base_sign', eval=ref_base_sign))
-
-                    ref_tax_sign       = e.xpath("field[@name='ref_tax_sign']")
-                    if ref_tax_sign:
-                        ref_tax_sign = ref_tax_sign[0].get("eval")
-                        f.append(m.field(name='credit_note_tax_sign', eval=ref_tax_sign))
-                else:
-                    f.append(m.field('none', name='type'))
-
-                parent             = e.xpath("field[@name='parent_id']")
-                if parent:
-                    parent = parent[0].get("ref")
-                    f.append(m.field(name='parent', ref=parent))
-
-                tax_type           = e.xpath("field[@name='type_tax_use']")[0].text
-                # openerp-7.0-20140125-002455/openerp/addons/account/account.py
-                # 'type_tax_use': fields.selection([('sale','Sale'),('purchase','Purchase'),('all','All')], 'Tax Application', required=True)
-                # this can be 'all'
-                # this also hardwires the ids from the account.tax.group
-                f.append(m.field(name='group', ref='tax_group_%s' % tax_type))
-
-                f.append(m.field(name='account', ref=dChartConfig['root_account_template_id']))
-                # VAT rates change with time, and OERP dont;
-                # fill the field in as the beginning of computer time
-                # to  signal it can ce changed, and then let others correct it
-                f.append(m.field('1971-01-01', name='start_date'))
-                # FixMe: a better way is to make changable taxes
-                # children of a tax.template of kind-none
-                # see tax_fr.xml
-            except Exception, e:
-                (type, value, traceback,) = sys.exc_info()
-                value = "ID=%s " % (id,) + str(value)
-                raise type, value, traceback
-            f = tuple(f)
-            r.append(
-                m.record(*f, id=id, model=model)
-            )
-
-        return r
+                    f.append(m.field('percentage', name='type'))
+                f += self.map_fields(dFields, lTaxTemplatePercentageFields)
+            else:
+                f.append(m.field('none', name='type'))
+
+            parent = dFields.get('parent_id')
+            if parent is not None:
+                f.append(m.field(name='parent', ref=parent.get("ref")))
+
+            tax_type = dFields['type_tax_use'].text
+            # openerp-7.0-20140125-002455/openerp/addons/account/account.py
+            # 'type_tax_use': fields.selection([('sale','Sale'),('purchase','Purchase'),('all','All')], 'Tax Application', required=True)
+            # this can be 'all'
+            # this also hardwires the ids from the account.tax.group
+            f.append(m.field(name='group', ref='tax_group_%s' % tax_type))
+
+            f.append(m.field(name='account', ref=oConfig.root_account_template_id))
+            # VAT rates change with time, and OERP dont;
+            # fill the field in as the beginning of computer time
+            # to  signal it can ce changed, and then let others correct it
+            f.append(m.field('1971-01-01', name='start_date'))
+            # FixMe: a better way is to make changable taxes
+            # children of a tax.template of kind-none
+            # see tax_fr.xml
+        except Exception, e:
+            (type, value, traceback,) = sys.exc_info()
+            value = "ID=%s " % (id,) + str(value)
+            raise type, value, traceback
+        f = tuple(f)
+        return m.record(*f, id=id, model=model)
+
+    def map_fields(self, dFields, lTable):
+        """Convert the fields in dFields that are in the mapping table lTable,
+        in the order of the table: a search by code for the fields
+        that refer to a model, or a copy of the eval for the others.
+        """
+        m = self.maker
+        f = []
+        for sOerp, sTryton, sModel in lTable:
+            oField = dFields.get(sOerp)
+            if oField is None:
+                continue
+            if sModel:
+                f.append(m.field(search="[('code', '=', '%s')]" % \
+                                 (oField.get("ref"),),
+                                 model=sModel,
+                                 name=sTryton,
+                             )
+                )
+            else:
+                # copied as it is, but it has to be a number
+                literals.number(oField.get("eval"))
+                f.append(m.field(name=sTryton, eval=oField.get("eval")))
+        return f
 
     def build_tax_rule_template(self):
         ## these should be in the chart, not the converter
         ## but at least now they are broken out to XML xmlfile files
         model="account.tax.rule.template"
-        if not self.oConfig.has_section(model): return []
-
-        dTaxRuleLineTemplate=dict(self.oConfig.items(model))
-        sFile=dTaxRuleLineTemplate['xmlfile']
-        if not os.path.exists(sFile):
-            sFile = os.path.join(os.path.dirname(self.oConfig.sConfigFile),
-                                 sFile)
-        if not os.path.exists(sFile): return []
-        assert os.path.exists(sFile), "File not found: "+sFile
-        oSubTree=ET.parse(sFile)
-
-        l = oSubTree.xpath("/tryton/data/record[@model='%s']" % model)
+        sFile = self.oConfig.sidecar(model)
+        if not sFile: return []
+
+        l = load_sidecar(sFile, model)
         #??
         return l
         m = self.maker
@@ -508,18 +1255,10 @@ class Converter(object):
         ## these should be in the chart, not the converter
         ## but at least now they are broken out to XML xmlfile files
         model="account.tax.rule.line.template"
-        if not self.oConfig.has_section(model): return []
-
-        dTaxRuleLineTemplate=dict(self.oConfig.items(model))
-        sFile=dTaxRuleLineTemplate['xmlfile']
-        if not os.path.exists(sFile):
-            sFile = os.path.join(os.path.dirname(self.oConfig.sConfigFile),
-                                 sFile)
-        if not os.path.exists(sFile): return []
-        assert os.path.exists(sFile), "File not found: "+sFile
-        oSubTree=ET.parse(sFile)
-
-        l = oSubTree.xpath("/tryton/data/record[@model='%s']" % model)
+        sFile = self.oConfig.sidecar(model)
+        if not sFile: return []
+
+        l = load_sidecar(sFile, model)
         #??
         return l
         m = self.maker
@@ -537,47 +1276,926 @@ class Converter(object):
 
         return r
 
+    def resolve_refs(self):
+        """Replace the searches by code of the output records with refs
+        to the ids of the account and tax code templates in the output,
+        where exactly one record of the model has the code; the others
+        are left as searches. Returns the number of searches replaced,
+        and the number left.
+        """
+        lTrees = [oTree for oTree in [self.outtree, self.taxtree]
+                  if oTree is not None]
+        dCodes = dict()
+        for oTree in lTrees:
+            for e in oTree[0]:
+                sModel = e.get('model')
+                if sModel not in ('account.account.template',
+                                  'account.tax.code.template',):
+                    continue
+                for oField in e:
+                    if oField.get('name') == 'code':
+                        dIds = dCodes.setdefault((sModel, oField.text,), dict())
+                        dIds[e.get('id')] = True
+                        break
+
+        iResolved = 0
+        iLeft = 0
+        for oTree in lTrees:
+            for e in oTree[0]:
+                for oField in e:
+                    sSearch = oField.get('search')
+                    if sSearch is None:
+                        continue
+                    oMatch = oSearchByCode.match(sSearch)
+                    dIds = oMatch and \
+                        dCodes.get((oField.get('model'), oMatch.group(1),))
+                    if not dIds or len(dIds) > 1:
+                        iLeft += 1
+                        continue
+                    sName = oField.get('name')
+                    if isinstance(oField, ir.Field):
+                        self.replace_field(e, oField, ir.Field(
+                            ('name', sName, 'ref', dIds.keys()[0],)))
+                    else:
+                        oField.attrib.clear()
+                        oField.set('name', sName)
+                        oField.set('ref', dIds.keys()[0])
+                    iResolved += 1
+        return (iResolved, iLeft,)
+
+    def validate(self):
+        """Check the references of the output records against the ids
+        and codes of the output, and return the list of the problems:
+        the ids used more than once, the refs to ids that are not in
+        the output, and the searches by code that find no record,
+        or more than one. The refs to other modules are not checked.
+        With --validate, the maker keeps the checks of the records as
+        it makes them, and the fields are only read again to list the
+        problems if those show that there are any.
+        """
+        if self.maker.oChecks is not None and self.checks_pass():
+            return []
+        return self.find_problems()
+
+    def checks_pass(self):
+        """Whether the output has none of the problems that validate
+        looks for, from the Checks that the maker has counted of the
+        records it made, if those are all in the output once, and the
+        fields of the records that it did not make: the xmlfile files,
+        and the copies and records of other processes.
+        """
+        oChecks = self.maker.oChecks
+        dRecords = oChecks.dRecords
+        iMade = 0
+        lOthers = []
+        for oTree in [self.outtree, self.taxtree]:
+            if oTree is None:
+                continue
+            for e in oTree[0]:
+                if e in dRecords:
+                    iMade += 1
+                else:
+                    lOthers.append(e)
+        if iMade != len(dRecords) or oChecks.iFields != oChecks.iRecordFields:
+            # a record made and not output, or output twice,
+            # or a field made and not in a record
+            return False
+        if lOthers:
+            oChecks = oChecks.copy()
+            for e in lOthers:
+                oChecks.add_record(e)
+
+        dIds = oChecks.dIds
+        for iCount in dIds.itervalues():
+            if iCount > 1:
+                return False
+        dRefs = oChecks.dRefs
+        for sRef in set(dRefs).difference(dIds):
+            if dRefs[sRef] > 0 and (sRef is None or '.' not in sRef):
+                return False
+        for sModel in ('account.account.template',
+                       'account.tax.code.template',):
+            dCodes = oChecks.dCodes.get(sModel, dict())
+            dSearches = oChecks.dSearches.get(sModel, dict())
+            for (sSearch, iCount,) in dSearches.items():
+                oMatch = oSearchByCode.match(sSearch)
+                if iCount > 0 and oMatch and \
+                       dCodes.get(oMatch.group(1), 0) != 1:
+                    return False
+        return True
+
+    def find_problems(self):
+        """The problems that validate returns, found by reading every
+        field of the output records, in the order of the output.
+        """
+        lTrees = [oTree for oTree in [self.outtree, self.taxtree]
+                  if oTree is not None]
+        lProblems = []
+        dIds = dict()
+        dCodes = {'account.account.template': dict(),
+                  'account.tax.code.template': dict(),
+                  }
+        # (model, id, field name, ref) of the refs, and with the search
+        # model and code of the searches by code, to check after the pass
+        lRefs = []
+        lSearches = []
+        # the attrib_shape of each tuple of attribute names: the fields
+        # are made by a few calls, so there are only a few of them
+        dShapes = dict()
+        for oTree in lTrees:
+            for e in oTree[0]:
+                if type(e) is ir.Record:
+                    (sModel, sId, lFields,) = (e.sModel, e.sId, e.lFields,)
+                else:
+                    # the lxml elements of the xmlfile files
+                    (sModel, sId,) = (e.get('model'), e.get('id'),)
+                    lFields = [ir.Field(tuple(itertools.chain(*oField.items())),
+                                        oField.text) for oField in e]
+                if sId in dIds:
+                    lProblems.append("duplicate id %s in %s" % (sId, sModel,))
+                dIds[sId] = True
+                dModelCodes = dCodes.get(sModel)
+                for oField in lFields:
+                    tAttrib = oField.tAttrib
+                    # most of the fields have no ref or search, and are
+                    # not a code: a value that is one of these names
+                    # only lets its field through to the shape below
+                    if 'ref' not in tAttrib and 'search' not in tAttrib and \
+                           'code' not in tAttrib:
+                        continue
+                    tKeys = tAttrib[::2]
+                    tShape = dShapes.get(tKeys)
+                    if tShape is None:
+                        tShape = dShapes[tKeys] = attrib_shape(tKeys)
+                    (iRef, iSearch, iName, iModel,) = tShape
+                    sName = tAttrib[iName] if iName is not None else None
+                    if iRef is not None:
+                        sRef = tAttrib[iRef]
+                        if '.' not in sRef:
+                            lRefs.append((sModel, sId, sName, sRef,))
+                    elif iSearch is not None:
+                        oMatch = oSearchByCode.match(tAttrib[iSearch])
+                        if oMatch:
+                            lSearches.append((sModel, sId, sName,
+                                              tAttrib[iModel] if iModel is not None else None,
+                                              oMatch.group(1),))
+                    elif dModelCodes is not None and sName == 'code':
+                        sCode = oField.text
+                        dModelCodes[sCode] = dModelCodes.get(sCode, 0) + 1
+
+        for (sModel, sId, sName, sRef,) in lRefs:
+            if sRef not in dIds:
+                lProblems.append("%s %s: %s ref to missing id '%s'" % (
+                    sModel, sId, sName, sRef,))
+        for (sModel, sId, sName, sSearchModel, sCode,) in lSearches:
+            if sSearchModel not in dCodes:
+                continue
+            iFound = dCodes[sSearchModel].get(sCode, 0)
+            if iFound != 1:
+                lProblems.append("%s %s: %s search finds %d %s with code '%s'" % (
+                    sModel, sId, sName, iFound, sSearchModel, sCode,))
+        return lProblems
+
+    def delta(self, lPrevious):
+        """Keep only the records of the output trees that are new,
+        or have changed, against the records in the previous output
+        files lPrevious, matching them by model and id and comparing
+        a hash of their content. Returns the list of (model, id,)
+        of the previous records that are no longer in the output.
+        """
+        dPrevious = dict()
+        for sFile in lPrevious:
+            assert os.path.exists(sFile), "File not found: "+sFile
+            for (sEvent, e) in ET.iterparse(sFile, events=('end',), tag='record'):
+                dPrevious[(e.get('model'), e.get('id'),)] = record_hash(e)
+                e.clear()
+                while e.getprevious() is not None:
+                    del e.getparent()[0]
+
+        dCurrent = dict()
+        for oTree in [self.outtree, self.taxtree]:
+            if oTree is None:
+                continue
+            oData = oTree[0]
+            for e in list(oData):
+                tKey = (e.get('model'), e.get('id'),)
+                dCurrent[tKey] = True
+                if dPrevious.get(tKey) == record_hash(e):
+                    oData.remove(e)
+        return [tKey for tKey in dPrevious if tKey not in dCurrent]
+
     def write(self):
+        self.stage('write', self.write_files)
+
+    def write_files(self):
         outfile = self.oValues.sOutfile
         taxfile = self.oValues.sTaxfile
         if not outfile or outfile == '-':
-            u = self.render(self.outtree)
-            assert u
-            sys.stdout.write(u)
+            write_records(sys.stdout, self.outtree[0])
             return
 
         if taxfile:
-            u = self.render(self.taxtree)
-            assert u
-            with open(taxfile, 'wt') as oFd:
-                oFd.write(u)
+            with open(taxfile, 'wb') as oFd:
+                write_records(oFd, self.taxtree[0])
             # drop through
 
-        u = self.render(self.outtree)
-        assert u
-        with open(outfile, 'wt') as oFd:
-            oFd.write(u)
+        with open(outfile, 'wb') as oFd:
+            write_records(oFd, self.outtree[0])
+
+    def write_stages(self, infile):
+        """Convert infile and write its records as write_files writes
+        the output trees, but without making them: the records of each
+        of the lOutputStages are written as soon as the stage is built,
+        and only the records of one stage are kept at a time. The files
+        are written as .tmp files next to them, that are renamed into
+        place once they are all written, so a conversion that fails
+        on the way leaves no half written output.
+        """
+        outfile = self.oValues.sOutfile
+        taxfile = self.oValues.sTaxfile
+        # a streamed input is converted in one pass, before the first
+        # stage can be written: its records wait in a spool, not in memory
+        oSpool = RecordSpool() if self.streams(infile) else None
+        oStages = iter(self.iter_stages(infile, oSpool))
+        # the chart of accounts is the first of the stages,
+        # and the chart of taxes is the rest of them
+        oRecords = itertools.chain.from_iterable(
+            lRecords for (sStage, lRecords,) in
+            itertools.islice(oStages, len(self.lAccountStages)))
+        oTaxRecords = itertools.chain.from_iterable(
+            lRecords for (sStage, lRecords,) in oStages)
+        if not taxfile:
+            oRecords = itertools.chain(oRecords, oTaxRecords)
+        if not outfile or outfile == '-':
+            # as write_files: only the chart of accounts if there is a taxfile
+            try:
+                write_records(sys.stdout, oRecords)
+            finally:
+                if oSpool is not None:
+                    oSpool.close()
+            return
+
+        lFiles = [(outfile, oRecords,)]
+        if taxfile:
+            lFiles.append((taxfile, oTaxRecords,))
+        try:
+            for (sFile, oFileRecords,) in lFiles:
+                with open(sFile + '.tmp', 'wb') as oFd:
+                    write_records(oFd, oFileRecords)
+        except:
+            for (sFile, oFileRecords,) in lFiles:
+                if os.path.exists(sFile + '.tmp'):
+                    os.unlink(sFile + '.tmp')
+            raise
+        finally:
+            if oSpool is not None:
+                oSpool.close()
+        for (sFile, oFileRecords,) in lFiles:
+            os.rename(sFile + '.tmp', sFile)
+
+    def write_sql(self):
+        """Write the output records as SQL to the --sql file, and the
+        stand-in schema of their tables to the --sql-schema file.
+        Returns the number of refs and searches left NULL.
+        """
+        import sqlout
+        lRecords = list(self.outtree[0])
+        if self.taxtree is not None:
+            lRecords += list(self.taxtree[0])
+        oTables = sqlout.Tables(lRecords)
+        if self.oValues.sSqlSchemaFile:
+            with open(self.oValues.sSqlSchemaFile, 'wb') as oFd:
+                sqlout.write_schema(oFd, oTables)
+        with open(self.oValues.sSqlFile, 'wb') as oFd:
+            if self.oValues.sSqlFormat == 'copy':
+                sqlout.write_copy(oFd, oTables, self.oValues.sSqlModule)
+            else:
+                sqlout.write_insert(oFd, oTables, self.oValues.sSqlModule,
+                                    self.oValues.sSqlFormat != 'sqlite')
+        return oTables.iUnresolved
+
+    def write_shards(self):
+        """Write the output records as the shards of shard_records, XML
+        files to load one after the other, to the --shards directory,
+        over a pool of processes, and the manifest of their load order
+        to shards.cfg in it, as the xml list of a tryton.cfg.
+        Returns the list of (file name, number of records,) in load order.
+        """
+        oValues = self.oValues
+        lRecords = list(self.outtree[0])
+        if self.taxtree is not None:
+            lRecords += list(self.taxtree[0])
+        lShards = shard_records(lRecords, self.oConfig.root_account_template_id,
+                                oValues.sShardBy, oValues.iShardSize)
+        sDir = oValues.sShardDir
+        if not os.path.isdir(sDir):
+            os.makedirs(sDir)
+        lFiles = []
+        for i, (sName, lShard,) in enumerate(lShards):
+            sFile = '%03d_%s.xml' % (i, re.sub(r'[^A-Za-z0-9_.-]', '_', sName),)
+            lFiles.append((sFile, lShard,))
+        write_shard_files([(os.path.join(sDir, sFile), lShard,)
+                           for (sFile, lShard,) in lFiles],
+                          getattr(oValues, 'iJobs', 0))
+        with open(os.path.join(sDir, 'shards.cfg'), 'wt') as oFd:
+            oFd.write("# the shards of the chart, in the order to load them:\n"
+                      "# the xml list for the tryton.cfg of the module\n"
+                      "[tryton]\n"
+                      "xml:\n")
+            for (sFile, lShard,) in lFiles:
+                oFd.write("    %s\n" % (sFile,))
+        return [(sFile, len(lShard),) for (sFile, lShard,) in lFiles]
 
     def render(self, e):
-        uRetval = ET.tostring(e, encoding='UTF-8', pretty_print=True,
-                              xml_declaration=True)
-        if uRetval.find('><') > 0:
-            # grr- there has to be a way to pretty print the tax code
-            uRetval = uRetval.replace("><field", ">\n      <field")
-            uRetval = uRetval.replace("><", ">\n    <")
-        return uRetval
-    
-def main(lArgs):
-    global CURRENT_LANG
-    (oValues, lArguments) = oParser.parse_args(lArgs)
+        """The bytes of the <tryton> tree e, as write_records writes it."""
+        from StringIO import StringIO
+        oFd = StringIO()
+        write_records(oFd, e[0])
+        return oFd.getvalue()
+
+def in_daemon_process():
+    """If this is a pool process, of a --batch or of converterd, that
+    cannot have children of its own.
+    """
+    import multiprocessing
+    return multiprocessing.current_process().daemon
+
+def is_xml_bytes(infile):
+    """Whether infile is the bytes of an XML document, not a file name:
+    they start with a '<', after any UTF-8 byte order mark and spaces."""
+    if isinstance(infile, bytearray):
+        return True
+    if not isinstance(infile, str):
+        return False
+    if infile.startswith(codecs.BOM_UTF8):
+        infile = infile[len(codecs.BOM_UTF8):]
+    return infile[:1024].lstrip()[:1] == '<'
+
+def convert(infile, oConfig, oValues=None, lHooks=(), sLang=None):
+    """Yield the Tryton records converted from infile with the config
+    oConfig, one at a time; see Converter.iter_records.
+    """
+    oConverter = Converter(oConfig=oConfig, oValues=oValues, lHooks=lHooks,
+                           sLang=sLang)
+    return oConverter.iter_records(infile)
+
+def copy_records(lRecords):
+    """Copies of the records lRecords, to put in a tree of their own:
+    the ir Records share their Fields."""
+    return [e.copy() if isinstance(e, ir.Record) else copy.deepcopy(e)
+            for e in lRecords]
+
+class SpooledRecord(object):
+    """An ir Record that has been written to a RecordSpool: its model,
+    id and parent ref, to put it in order with sort_parents_first,
+    and the offset and length of its bytes in the spool."""
+    __slots__ = ('sModel', 'sId', 'sParent', 'iOffset', 'iLength',)
+
+    def __init__(self, sModel, sId, sParent, iOffset, iLength):
+        self.sModel = sModel
+        self.sId = sId
+        self.sParent = sParent
+        self.iOffset = iOffset
+        self.iLength = iLength
+
+    def get(self, sKey, oDefault=None):
+        if sKey == 'model':
+            return self.sModel
+        if sKey == 'id':
+            return self.sId
+        return oDefault
+
+class RecordSpool(object):
+    """A temporary file that the records converted from a streamed
+    input are written to, by ir.tostring, as they are made, and read
+    back from in output order: the input has to be all read before
+    the first stage is complete, and this keeps only the order of the
+    records in memory, not the records."""
+
+    def __init__(self):
+        import tempfile
+        self.oFd = tempfile.TemporaryFile()
+        self.iOffset = 0
+
+    def add(self, e):
+        """Write the ir Record e to the spool and return its SpooledRecord;
+        anything else, like the lxml records, is returned as it is."""
+        if type(e) is not ir.Record:
+            return e
+        s = ir.tostring(e)
+        self.oFd.write(s)
+        oRecord = SpooledRecord(e.sModel, e.sId, parent_ref(e),
+                                self.iOffset, len(s))
+        self.iOffset += len(s)
+        return oRecord
+
+    def read(self, lRecords):
+        """Yield the records of lRecords, with the bytes of each of the
+        SpooledRecords read back from the spool in its place."""
+        oFd = self.oFd
+        for e in lRecords:
+            if type(e) is SpooledRecord:
+                oFd.seek(e.iOffset)
+                e = oFd.read(e.iLength)
+            yield e
+
+    def close(self):
+        self.oFd.close()
+
+class SpooledList(list):
+    """The records of a stage, that writes the records appended to it
+    to the RecordSpool oSpool, and keeps their SpooledRecords.
+    With bHoldOrphans, a record whose parent is not in the list yet is
+    kept as it is, not written, so that the finish_* method of the
+    stage can still change it."""
+    __slots__ = ('oSpool', 'dIds',)
+
+    def __init__(self, oSpool, lRecords=(), bHoldOrphans=False):
+        list.__init__(self)
+        self.oSpool = oSpool
+        # the ids of the records in the list, with bHoldOrphans
+        self.dIds = dict() if bHoldOrphans else None
+        for e in lRecords:
+            self.append(e)
+
+    def append(self, e):
+        dIds = self.dIds
+        if dIds is not None and type(e) is ir.Record:
+            dIds[e.sId] = True
+            sParent = parent_ref(e)
+            if sParent is not None and sParent not in dIds:
+                list.append(self, e)
+                return
+        list.append(self, self.oSpool.add(e))
+
+# the models whose records refer to a record of the same model
+# by their parent field, that has to come before them
+lHierarchicalModels = ['account.account.type.template',
+                       'account.account.template',
+                       'account.tax.code.template',
+                       'account.tax.template',
+                       ]
+
+def parent_ref(e):
+    """The ref of the parent field of the record e, or None."""
+    if type(e) is SpooledRecord:
+        return e.sParent
+    # the build_* methods mostly put the parent last
+    if len(e) and e[-1].get('name') == 'parent':
+        return e[-1].get('ref')
+    for oField in e:
+        if oField.get('name') == 'parent':
+            return oField.get('ref')
+    return None
+
+def sort_parents_first(lRecords):
+    """Return the records of the list lRecords in the same order,
+    except that the records of the lHierarchicalModels whose parent
+    is later in the list are moved to just after their parent
+    (and after the children of their parent that were before them).
+    A list that already has its parents first is returned in the same
+    order. Raises an AssertionError with the path of a cycle of parents.
+    """
+    # the key and the key of the parent of each record, and whether
+    # each record of the lHierarchicalModels has been sorted yet
+    lKeys = []
+    dIndex = dict()
+    for e in lRecords:
+        sModel = e.get('model')
+        if sModel in lHierarchicalModels:
+            tKey = (sModel, e.get('id'),)
+            dIndex[tKey] = False
+            lKeys.append((e, tKey, (sModel, parent_ref(e),),))
+        else:
+            lKeys.append((e, None, None,))
+
+    lSorted = []
+    # the records that wait for their parent, by the key of the parent
+    dWaiting = dict()
+    for t in lKeys:
+        if t[2] is not None and dIndex.get(t[2]) is False:
+            dWaiting.setdefault(t[2], []).append(t)
+            continue
+        lStack = [t]
+        while lStack:
+            (e, tKey, tParent,) = lStack.pop()
+            lSorted.append(e)
+            if tKey is not None and not dIndex[tKey]:
+                dIndex[tKey] = True
+                lStack.extend(reversed(dWaiting.pop(tKey, [])))
+
+    if dWaiting:
+        # whatever is still waiting is on, or under, a cycle of parents:
+        # go up from the first of them until a record comes round again
+        dRecords = dict()
+        for e in lRecords:
+            dRecords.setdefault((e.get('model'), e.get('id'),), e)
+        for e in lRecords:
+            tKey = (e.get('model'), e.get('id'),)
+            if tKey in dIndex and not dIndex[tKey]:
+                break
+        lPath = []
+        while tKey not in lPath:
+            lPath.append(tKey)
+            tKey = (tKey[0], parent_ref(dRecords[tKey]),)
+        lPath = lPath[lPath.index(tKey):] + [tKey]
+        assert False, "Cycle of parents in %s: %s" % (
+            tKey[0], ' -> '.join([t[1] for t in lPath]),)
+    return lSorted
+
+def record_hash(e):
+    """A hash of the content of the record e: the attributes and text
+    of its fields, without the whitespace that it was laid out with.
+    """
+    l = [e.get('model'), e.get('id')]
+    for oField in e:
+        if not isinstance(oField.tag, basestring):
+            continue
+        l.append(oField.tag)
+        l.append(sorted(oField.items()))
+        l.append((oField.text or '').strip())
+    return hashlib.sha1(repr(l)).hexdigest()
+
+def write_records(oFd, lRecords):
+    """Write the records as a <tryton><data> document to the file oFd,
+    one record at a time as they come from the iterable lRecords,
+    with the layout that libxml2 gives the whole tree when it is indented.
+    The ir Records that we made are written by ir.tostring; the lxml
+    records read from xmlfile files already have their own whitespace.
+    """
+    oFd.write("<?xml version='1.0' encoding='UTF-8'?>\n<tryton>\n  ")
+    oIter = iter(lRecords)
+    e = next(oIter, None)
+    if e is None:
+        oFd.write('<data/>')
+    else:
+        oFd.write('<data>')
+        write_data_records(oFd, e, oIter)
+        oFd.write('</data>')
+    oFd.write('\n</tryton>\n')
+
+def write_data_records(oFd, e, oIter):
+    """Write the first record e and the rest of the records in oIter
+    into the <data> element that write_records has opened in oFd.
+    """
+    # like libxml2, give up the pretty printing at the end
+    # of <data> if there is text whitespace in the records
+    bText = False
+    sTail = None
+    for e in itertools.chain([e], oIter):
+        if sTail is None:
+            oFd.write('\n    ')
+        if type(e) is str:
+            # the bytes of a record that ir.tostring has made already
+            oFd.write(e)
+            sTail = None
+            continue
+        if type(e) is ir.Record:
+            oFd.write(ir.tostring(e))
+            sTail = None
+            continue
+        if e.text is None and len(e):
+            ET.indent(e, space='  ', level=2)
+        sTail = e.tail
+        if sTail is not None:
+            bText = True
+        oFd.write(ET.tostring(e, encoding='UTF-8'))
+    if sTail is None:
+        if bText:
+            oFd.write('\n    ')
+        else:
+            oFd.write('\n  ')
+
+def shard_records(lRecords, sRootId, sShardBy='subtree', iSize=0):
+    """Split the output records lRecords into shards, to load one after
+    the other, and return the list of (name, list of records,) of each,
+    in load order. By subtree, the account types and the root account
+    sRootId come first, in the shard head; then the accounts of each
+    subtree under the root, in a shard named after the top account of
+    the subtree; and then all of the rest, the taxes, in the shard taxes.
+    Each of these is split into parts of iSize records, if it is more.
+    By count, the records are split into parts of iSize records.
+    The records keep their output order in each shard, so that every
+    parent loads before its children, as does every record that is
+    referred to or searched for; the parents are checked.
+    """
+    if sShardBy == 'count':
+        lGroups = [('part', list(lRecords),)]
+    else:
+        lHead = []
+        lTaxes = []
+        # the records of each subtree, by the id of its top account,
+        # and the top account of each account in a subtree
+        dSubtrees = OrderedDict()
+        dTops = dict()
+        for e in lRecords:
+            sModel = e.get('model')
+            if sModel == 'account.account.type.template' or \
+                   (sModel == 'account.account.template' and
+                    e.get('id') == sRootId):
+                lHead.append(e)
+            elif sModel == 'account.account.template':
+                # the children of the root, and the accounts whose parent
+                # is not an account before them, are the top of a subtree
+                sTop = dTops.get(parent_ref(e), e.get('id'))
+                dTops[e.get('id')] = sTop
+                dSubtrees.setdefault(sTop, []).append(e)
+            else:
+                lTaxes.append(e)
+        lGroups = [('head', lHead,)] + dSubtrees.items() + [('taxes', lTaxes,)]
+
+    lShards = []
+    for (sName, lGroup,) in lGroups:
+        if not lGroup:
+            continue
+        if iSize <= 0 or len(lGroup) <= iSize:
+            lShards.append((sName, lGroup,))
+            continue
+        for i in range(0, len(lGroup), iSize):
+            lShards.append(('%s_%d' % (sName, i / iSize + 1,),
+                            lGroup[i:i+iSize],))
+
+    # check that no parent is in a shard after its child
+    dShards = dict()
+    for i, (sName, lShard,) in enumerate(lShards):
+        for e in lShard:
+            dShards.setdefault((e.get('model'), e.get('id'),), i)
+    for i, (sName, lShard,) in enumerate(lShards):
+        for e in lShard:
+            sModel = e.get('model')
+            if sModel not in lHierarchicalModels:
+                continue
+            iParent = dShards.get((sModel, parent_ref(e),), i)
+            assert iParent <= i, "%s %s in shard %s is before its parent in shard %s" % (
+                sModel, e.get('id'), sName, lShards[iParent][0],)
+    return lShards
+
+# the shards that a process of write_shard_files writes, as (file
+# name, records,): they are passed to it as it forks, not pickled
+lProcessShards = []
+
+def init_shard_process(lShards):
+    lProcessShards[:] = lShards
+
+def write_shard(i):
+    (sFile, lRecords,) = lProcessShards[i]
+    with open(sFile, 'wb') as oFd:
+        write_records(oFd, lRecords)
+    return i
+
+def write_shard_files(lShards, iJobs=0):
+    """Write each of the list of (file name, records,) lShards as an
+    XML file over a pool of iJobs processes (defaults to the number of
+    cpus), or in this process if it is a pool process itself.
+    """
+    import multiprocessing
+    if iJobs <= 0:
+        iJobs = multiprocessing.cpu_count()
+    iJobs = min(iJobs, len(lShards))
+    if iJobs <= 1 or in_daemon_process():
+        for (sFile, lRecords,) in lShards:
+            with open(sFile, 'wb') as oFd:
+                write_records(oFd, lRecords)
+        return
+    oPool = multiprocessing.Pool(iJobs, init_shard_process, (lShards,))
+    try:
+        for i in oPool.imap_unordered(write_shard, range(len(lShards))):
+            pass
+    finally:
+        oPool.close()
+        oPool.join()
+
+# the options of a job in a --batch manifest, and the converter options
+lBatchOptions = [('config', '--config'),
+                 ('lang', '--lang'),
+                 ('outfile', '--outfile'),
+                 ('taxfile', '--taxfile'),
+                 ]
+
+def read_manifest(sManifest):
+    """Read the --batch manifest: a config file with a section per job,
+    that has an infile and optionally a config, lang, outfile, taxfile
+    and stream. Returns a list of (job name, converter arguments,).
+    """
+    assert os.path.exists(sManifest), "File not found: "+sManifest
+    sDir = os.path.dirname(os.path.abspath(sManifest))
+    oManifest = ConfigParser()
+    oManifest.readfp(open(sManifest))
+    lJobs = []
+    for sJob in oManifest.sections():
+        dJob = dict(oManifest.items(sJob))
+        assert 'infile' in dJob, "infile not in job %s of %s" % (sJob, sManifest,)
+        # check the options here, as optparse would exit in the pool process
+        if dJob.get('lang'):
+            assert dJob['lang'] in dLang, "lang %s of job %s not in %r" % (
+                dJob['lang'], sJob, sorted(dLang),)
+        if dJob.get('config'):
+            sConfigFile = os.path.join(sDir, dJob['config'])
+            assert os.path.exists(sConfigFile), \
+                "File not found: %s in job %s" % (sConfigFile, sJob,)
+        lArgs = []
+        for sKey, sOption in lBatchOptions:
+            if dJob.get(sKey):
+                lArgs += [sOption, dJob[sKey]]
+        if oManifest.has_option(sJob, 'stream') and \
+               oManifest.getboolean(sJob, 'stream'):
+            lArgs += ['--stream']
+        lArgs += [dJob['infile']]
+        lJobs.append((sJob, lArgs,))
+    return lJobs
+
+def run_job(tJob):
+    """Run one job of a --batch in a pool process,
+    and return (job name, error message or '', seconds,).
+    """
+    import time, traceback
+    (sJob, lArgs,) = tJob
+    fStart = time.time()
+    try:
+        iReturn = main(lArgs)
+    except SystemExit, e:
+        # optparse exits on bad arguments: the pool would wait forever
+        # for the result of a process that has gone
+        iReturn = e.code if isinstance(e.code, int) else 1
+    except Exception, e:
+        sError = ''.join(traceback.format_exception_only(type(e), e)).strip()
+        return (sJob, sError or repr(e), time.time() - fStart,)
+    if iReturn:
+        return (sJob, "exit status %d" % (iReturn,), time.time() - fStart,)
+    return (sJob, '', time.time() - fStart,)
+
+def batch(sManifest, iJobs=0):
+    """Convert the charts in the manifest over a pool of processes,
+    with the file names relative to the directory of the manifest,
+    or one after the other in this process if it is a pool process
+    itself, of converterd, that cannot have children.
+    A job that fails is reported, but does not stop the others.
+    Returns the number of jobs that failed.
+    """
+    import time, multiprocessing
+    lJobs = read_manifest(sManifest)
+    sDir = os.path.dirname(os.path.abspath(sManifest))
+    if iJobs <= 0:
+        iJobs = multiprocessing.cpu_count()
+    iJobs = max(1, min(iJobs, len(lJobs)))
+
+    fStart = time.time()
+    iFailed = 0
+    sCwd = os.getcwd()
+    if in_daemon_process():
+        iJobs = 1
+        oPool = None
+        os.chdir(sDir)
+        oResults = itertools.imap(run_job, lJobs)
+    else:
+        oPool = multiprocessing.Pool(iJobs, os.chdir, (sDir,))
+        oResults = oPool.imap_unordered(run_job, lJobs)
+    try:
+        for (sJob, sError, fSeconds,) in oResults:
+            if sError:
+                iFailed += 1
+                sys.stderr.write("FAIL %s %.2fs %s\n" % (sJob, fSeconds, sError,))
+            else:
+                sys.stderr.write("ok   %s %.2fs\n" % (sJob, fSeconds,))
+    finally:
+        if oPool is None:
+            os.chdir(sCwd)
+        else:
+            oPool.close()
+            oPool.join()
+    sys.stderr.write("%d of %d jobs failed in %.2fs on %d processes\n" % (
+        iFailed, len(lJobs), time.time() - fStart, iJobs,))
+    return iFailed
+
+def read_matrix(sManifest):
+    """Read the --matrix manifest: a config file with a section per
+    target, that has an outfile and optionally a config, lang and
+    taxfile, and the infile of all of them in its [DEFAULT] section.
+    Returns (infile or None, list of (target name, dict of options,),).
+    """
+    assert os.path.exists(sManifest), "File not found: "+sManifest
+    oManifest = ConfigParser()
+    oManifest.readfp(open(sManifest))
+    lTargets = []
+    for sTarget in oManifest.sections():
+        dTarget = dict(oManifest.items(sTarget))
+        assert dTarget.get('outfile'), \
+            "outfile not in target %s of %s" % (sTarget, sManifest,)
+        lTargets.append((sTarget, dTarget,))
+    return (oManifest.defaults().get('infile'), lTargets,)
+
+def matrix(sManifest, oValues, sInfile=None):
+    """Convert one chart for each of the targets in the manifest: the
+    input is parsed and indexed once, and each target is converted from
+    it with its own config and lang, and the other options of oValues.
+    The file names are relative to the directory of the manifest, and
+    sInfile, if it is given, is converted instead of its infile.
+    A target that fails is reported, but does not stop the others.
+    Returns the number of targets that failed.
+    """
+    import time, traceback
+    (sManifestInfile, lTargets,) = read_matrix(sManifest)
+    sInfile = sInfile and os.path.abspath(sInfile) or sManifestInfile
+    assert sInfile, "infile not in the [DEFAULT] of "+sManifest
+    fStart = time.time()
+    iFailed = 0
+    sCwd = os.getcwd()
+    # the xmlfile files of the configs are found from here too
+    os.chdir(os.path.dirname(os.path.abspath(sManifest)))
+    try:
+        assert os.path.exists(sInfile), "File not found: "+sInfile
+        oInput = Converter(oValues=oValues)
+        oInput.parse(sInfile)
+        sys.stderr.write("parsed %s in %.2fs\n" % (sInfile, time.time() - fStart,))
+
+        for (sTarget, dTarget,) in lTargets:
+            fTarget = time.time()
+            oTargetValues = copy.copy(oValues)
+            oTargetValues.sLang = dTarget.get('lang') or oValues.sLang
+            oTargetValues.sConfigFile = dTarget.get('config') or \
+                default_config(oTargetValues.sLang)
+            oTargetValues.sOutfile = dTarget['outfile']
+            oTargetValues.sTaxfile = dTarget.get('taxfile') or ''
+            try:
+                c = Converter(oConfig=ChartConfig.read(oTargetValues.sConfigFile),
+                              oValues=oTargetValues)
+                c.convert_from(oInput)
+                iReturn = write_output(c, oTargetValues)
+                sError = "problems found" if iReturn else ''
+            except Exception, e:
+                sError = ''.join(traceback.format_exception_only(type(e), e)).strip()
+            if sError:
+                iFailed += 1
+                sys.stderr.write("FAIL %s %.2fs %s\n" % (
+                    sTarget, time.time() - fTarget, sError,))
+            else:
+                sys.stderr.write("ok   %s %.2fs\n" % (sTarget, time.time() - fTarget,))
+    finally:
+        os.chdir(sCwd)
+    sys.stderr.write("%d of %d targets failed in %.2fs\n" % (
+        iFailed, len(lTargets), time.time() - fStart,))
+    return iFailed
+
+def default_config(sLang):
+    """The config file of the language sLang, that comes with the converter."""
+    ## provide a default based on the language
+    ## that way we can provide some examples
+    ## and hopefully standardize chart ids within a language
+    return os.path.join(sTopDir, sLang+'.cfg')
+
+def write_output(c, oValues):
+    """Resolve, validate and write the output of the converter c,
+    as the options oValues say. Returns 1 if --validate finds problems,
+    and nothing is written, or else 0.
+    """
+    if oValues.bResolveRefs:
+        (iResolved, iLeft,) = c.stage('resolve_refs', c.resolve_refs)
+        sys.stderr.write("resolved %d searches to refs, %d left as searches\n" % (
+            iResolved, iLeft,))
+    if oValues.bValidate:
+        lProblems = c.stage('validate', c.validate)
+        if lProblems:
+            sys.stderr.write(''.join(["%s\n" % s for s in lProblems]))
+            sys.stderr.write("%d problems found, nothing written\n" % (
+                len(lProblems),))
+            return 1
+    if oValues.lPrevious:
+        lRemoved = c.stage('delta', c.delta, oValues.lPrevious)
+        sRemoved = ''.join(["%s %s\n" % tKey for tKey in lRemoved])
+        if oValues.sRemovedFile:
+            with open(oValues.sRemovedFile, 'wt') as oFd:
+                oFd.write(sRemoved)
+        else:
+            sys.stderr.write(sRemoved)
+    if oValues.sSqlFile:
+        iUnresolved = c.stage('write_sql', c.write_sql)
+        if iUnresolved:
+            sys.stderr.write("%d refs and searches left NULL in %s\n" % (
+                iUnresolved, oValues.sSqlFile,))
+    elif oValues.sShardDir:
+        lFiles = c.stage('write_shards', c.write_shards)
+        sys.stderr.write("wrote %d records in %d shards to %s\n" % (
+            sum([iRecords for (sFile, iRecords,) in lFiles]), len(lFiles),
+            oValues.sShardDir,))
+    else:
+        c.write()
+    return 0
 
-    CURRENT_LANG=oValues.sLang
+def main(lArgs):
+    (oValues, lArguments) = make_parser().parse_args(lArgs)
 
     if oValues.bTest or '--test' in lArgs:
         import doctest
         ## FixMe: does doctest.testmod return an integer?
         return doctest.testmod(optionflags=doctest.ELLIPSIS)
 
+    if oValues.sBatchFile:
+        return batch(oValues.sBatchFile, oValues.iJobs)
+
+    if oValues.sMatrixFile:
+        return matrix(oValues.sMatrixFile, oValues,
+                      lArguments[0] if lArguments else None)
+
     if len(lArguments) == 1 and lArguments[0] != '-':
         sInfile=lArguments[0]
         assert os.path.exists(sInfile), "File not found: "+sInfile
@@ -589,19 +2207,54 @@ def main(lArgs):
     ## Im not convinced that all the info is there, or easy to find.
     sConfigFile=oValues.sConfigFile
     if not sConfigFile:
-        ## provide a default based on the language
-        ## that way we can provide some examples
-        ## and hopefully standardize chart ids within a language
-        sConfigFile=os.path.join(os.path.dirname(__file__),
-                                 oValues.sLang+'.cfg')
-
-    assert os.path.exists(sConfigFile), "File not found: "+sConfigFile
-    oConfig = ConfigParser()
-    oConfig.readfp(open(sConfigFile))
-    oConfig.sConfigFile = sConfigFile
-
-    c = Converter(sInfile, oConfig=oConfig, oValues=oValues)
-    c.write()
+        sConfigFile = default_config(oValues.sLang)
+
+    oConfig = ChartConfig.read(sConfigFile)
+
+    oCache = None
+    dOutputs = dict()
+    if oValues.sOutfile and oValues.sOutfile != '-':
+        dOutputs['outfile'] = oValues.sOutfile
+        if oValues.sTaxfile:
+            dOutputs['taxfile'] = oValues.sTaxfile
+    # a delta depends on the previous files too: dont cache it,
+    # and a profile is of the conversion, not of the cache
+    if not oValues.bNoCache and dOutputs and sInfile is not sys.stdin and \
+           not oValues.lPrevious and not oValues.sProfileFile and \
+           not oValues.sSqlFile and not oValues.sShardDir:
+        import cache
+        oCache = cache.Cache(oValues.sCacheDir,
+                             oValues.iCacheSize*1024*1024)
+        lInfiles = [sInfile]
+        if os.path.isdir(sInfile):
+            import csvchart
+            lInfiles = csvchart.lChartFiles(sInfile)
+        sKey = oCache.key(lInfiles + [sConfigFile] +
+                          [os.path.join(sTopDir, s) for s in lSourceFiles] +
+                          oConfig.lSidecarFiles(),
+                          [__version__, oValues.sLang, ' '.join(sorted(dOutputs)),
+                           str(oValues.bResolveRefs), str(oValues.bValidate)])
+        if oCache.fetch(sKey, dOutputs):
+            return 0
+
+    lHooks = []
+    if oValues.sProfileFile:
+        import stageprofile
+        oProfiler = stageprofile.StageProfiler(oValues.sProfileDump or None)
+        lHooks.append(oProfiler)
+    if oValues.bResolveRefs or oValues.bValidate or oValues.lPrevious or \
+           oValues.sSqlFile or oValues.sShardDir or oValues.bParallel:
+        # these need all of the output records at once
+        c = Converter(sInfile, oConfig=oConfig, oValues=oValues, lHooks=lHooks)
+        if write_output(c, oValues):
+            return 1
+    else:
+        c = Converter(oConfig=oConfig, oValues=oValues, lHooks=lHooks)
+        c.stage('write', c.write_stages, sInfile)
+    if oValues.sProfileFile:
+        oProfiler.write(oValues.sProfileFile)
+    if oCache:
+        oCache.store(sKey, dOutputs)
     return 0
 
 if __name__ == '__main__':
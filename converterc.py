@@ -0,0 +1,103 @@
+# -*- encoding: utf-8 -*-
+"""A thin client of the converter daemon converterd.py, that runs
+a conversion in the daemon instead of starting a converter.py:
+it takes the same arguments as converter.py, and writes the same
+output, but does not import lxml or the converter itself.
+An INPUTFILE of - is read from stdin, and sent to the daemon.
+
+usage: python converterc.py [--socket=SOCKET] [converter.py options] INPUTFILE
+       python converterc.py [--socket=SOCKET] --jobs JOBSFILE
+
+With --jobs, each line of JOBSFILE (or stdin, if it is -) is a JSON
+job for the daemon, and the JSON result of each job is written to
+stdout, one line each, as the jobs finish. A job is an object with
+the keys, all of them optional but one of infile and data:
+  id       a name for the job, that its result has too
+  infile   the input file name
+  data     the input chart itself, instead of infile
+  config   the config file name
+  lang     the language code
+  outfile  the output file name; without it, the output is in the result
+  taxfile  the tax output file name
+  args     a list of any other converter.py arguments
+  cwd      the directory the file names are relative to
+The result of a job has its id, ok, returncode, stdout, stderr and seconds.
+"""
+
+import sys, os
+import json
+import socket
+
+def default_socket():
+    """The path of the Unix socket of the daemon."""
+    sDir = os.environ.get('XDG_RUNTIME_DIR') or '/tmp'
+    return os.path.join(sDir, 'trytond_chart_converter-%d.sock' % os.getuid())
+
+def connect(sSocket=None):
+    oSocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    oSocket.connect(sSocket or default_socket())
+    return oSocket
+
+def iter_results(lJobs, sSocket=None):
+    """Send the jobs lJobs (dicts, or JSON lines, that the daemon checks)
+    to the daemon, and yield the dict of the result of each one,
+    in the order they finish.
+    """
+    oSocket = connect(sSocket)
+    try:
+        for dJob in lJobs:
+            if isinstance(dJob, dict):
+                dJob.setdefault('cwd', os.getcwd())
+                dJob = json.dumps(dJob)
+            oSocket.sendall(dJob.strip() + '\n')
+        oSocket.shutdown(socket.SHUT_WR)
+        oFd = oSocket.makefile('rb')
+        for sLine in oFd:
+            yield json.loads(sLine)
+    finally:
+        oSocket.close()
+
+def run(lArgs, sSocket=None):
+    """Run converter.py with the arguments lArgs in the daemon, write
+    its output and errors, and return its exit code.
+    """
+    dJob = dict(args=lArgs)
+    if '-' in lArgs:
+        # the input is on stdin
+        dJob['data'] = sys.stdin.read().decode('utf-8')
+    for dResult in iter_results([dJob], sSocket):
+        sys.stdout.write(dResult['stdout'].encode('utf-8'))
+        sys.stderr.write(dResult['stderr'].encode('utf-8'))
+        return dResult['returncode']
+    return 1
+
+def job(sLine):
+    """The job of the JSON line sLine, with the working directory of the
+    client; a line that is not a JSON object is sent as it is, for the
+    daemon to report.
+    """
+    try:
+        dJob = json.loads(sLine)
+    except ValueError:
+        return sLine
+    return dJob if isinstance(dJob, dict) else sLine
+
+def main(lArgs):
+    sSocket = None
+    if lArgs and lArgs[0].startswith('--socket='):
+        sSocket = lArgs[0][len('--socket='):]
+        lArgs = lArgs[1:]
+    if lArgs[:1] == ['--jobs'] and len(lArgs) == 2:
+        oFd = sys.stdin if lArgs[1] == '-' else open(lArgs[1])
+        lJobs = [job(sLine) for sLine in oFd if sLine.strip()]
+        iFailed = 0
+        for dResult in iter_results(lJobs, sSocket):
+            if not dResult['ok']:
+                iFailed += 1
+            sys.stdout.write(json.dumps(dResult) + '\n')
+            sys.stdout.flush()
+        return 1 if iFailed else 0
+    return run(lArgs, sSocket)
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,167 @@
+# -*- encoding: utf-8 -*-
+"""A converter daemon, that keeps the converter, lxml, the configs and
+the xmlfile files loaded, and runs the conversion jobs sent to it over
+a Unix socket on a pool of worker processes, so that a job does not
+pay for starting Python and reading them all again.
+
+A client sends its jobs as JSON lines, and gets the JSON result of each
+one back on a line of its own, as the jobs finish; see converterc.py,
+the thin client, for the format of the jobs and of the results. Each
+job runs converter.main, in the working directory of the client,
+so that it does just what converter.py would do with the same
+arguments, but its output comes back in its result.
+
+usage: python converterd.py [options]
+"""
+
+import sys, os
+import json
+import signal
+import time
+import Queue
+import SocketServer
+import multiprocessing
+from StringIO import StringIO
+from optparse import OptionParser
+
+import converter
+import converterc
+
+def job_args(dJob):
+    """The converter.py arguments of the job dJob."""
+    lArgs = []
+    # the keys of a job that are converter.py options are those of
+    # a job of a --batch manifest
+    for sKey, sOption in converter.lBatchOptions:
+        if dJob.get(sKey):
+            lArgs += [sOption, dJob[sKey]]
+    lArgs += list(dJob.get('args', []))
+    if dJob.get('infile'):
+        lArgs.append(dJob['infile'])
+    elif 'data' in dJob and '-' not in lArgs:
+        lArgs.append('-')
+    return [s.encode('utf-8') if isinstance(s, unicode) else s for s in lArgs]
+
+def run_job(dJob):
+    """Run the job dJob in a worker process, with its stdin, stdout and
+    stderr in memory, and return the dict of its result.
+    """
+    fStart = time.time()
+    (oStdin, oStdout, oStderr,) = (sys.stdin, sys.stdout, sys.stderr,)
+    sys.stdin = StringIO()
+    sys.stdout = StringIO()
+    sys.stderr = StringIO()
+    iReturn = 1
+    try:
+        try:
+            # a job with bad data fails like any other, with its result
+            sData = dJob.get('data')
+            if sData is None:
+                sData = ''
+            assert isinstance(sData, basestring), \
+                "the data of a job is a string, not %r" % (sData,)
+            if isinstance(sData, unicode):
+                sData = sData.encode('utf-8')
+            sys.stdin = StringIO(sData)
+            os.chdir(dJob.get('cwd') or '/')
+            iReturn = converter.main(job_args(dJob))
+        except SystemExit, e:
+            # optparse exits on bad arguments
+            iReturn = e.code if isinstance(e.code, int) else 1
+        except Exception, e:
+            sys.stderr.write("%s: %s\n" % (type(e).__name__, e,))
+        sOut = sys.stdout.getvalue()
+        sErr = sys.stderr.getvalue()
+    finally:
+        (sys.stdin, sys.stdout, sys.stderr,) = (oStdin, oStdout, oStderr,)
+    return dict(id=dJob.get('id'),
+                ok=iReturn == 0,
+                returncode=iReturn,
+                stdout=sOut.decode('utf-8', 'replace'),
+                stderr=sErr.decode('utf-8', 'replace'),
+                seconds=time.time() - fStart,
+                )
+
+class JobHandler(SocketServer.StreamRequestHandler):
+    """Read the jobs of a client a line at a time, start each one on
+    the pool as it comes, and write each result as it is ready.
+    """
+
+    def handle(self):
+        oResults = Queue.Queue()
+        iJobs = 0
+        iWritten = 0
+        for sLine in iter(self.rfile.readline, ''):
+            if not sLine.strip():
+                continue
+            try:
+                dJob = json.loads(sLine)
+                assert isinstance(dJob, dict), "a job is a JSON object"
+            except (ValueError, AssertionError,), e:
+                oResults.put(dict(id=None, ok=False, returncode=1,
+                                  stdout=u'', stderr=u'bad job: %s\n' % (e,),
+                                  seconds=0.0))
+            else:
+                dJob.setdefault('id', iJobs)
+                self.server.oPool.apply_async(run_job, (dJob,),
+                                              callback=oResults.put)
+            iJobs += 1
+            while not oResults.empty():
+                self.write_result(oResults.get())
+                iWritten += 1
+        while iWritten < iJobs:
+            self.write_result(oResults.get())
+            iWritten += 1
+
+    def write_result(self, dResult):
+        self.wfile.write(json.dumps(dResult) + '\n')
+        self.wfile.flush()
+
+class JobServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, sSocket, oPool):
+        self.oPool = oPool
+        SocketServer.UnixStreamServer.__init__(self, sSocket, JobHandler)
+
+def serve(sSocket, iJobs=0):
+    """Serve the jobs sent to the Unix socket sSocket on a pool of
+    iJobs processes (defaults to the number of cpus), until interrupted.
+    """
+    if iJobs <= 0:
+        iJobs = multiprocessing.cpu_count()
+    if os.path.exists(sSocket):
+        # left over from a daemon that did not stop cleanly
+        os.unlink(sSocket)
+    # fork the workers before the server starts any threads
+    oPool = multiprocessing.Pool(iJobs)
+    oServer = JobServer(sSocket, oPool)
+    # clean up on a kill, as on a ^C
+    signal.signal(signal.SIGTERM, lambda iSignal, oFrame: sys.exit(0))
+    sys.stderr.write("serving on %s with %d processes\n" % (sSocket, iJobs,))
+    try:
+        oServer.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        oServer.server_close()
+        os.unlink(sSocket)
+        oPool.terminate()
+        oPool.join()
+    return 0
+
+def main(lArgs):
+    oParser = OptionParser(usage=__doc__)
+    oParser.add_option("-S", "--socket",
+                       action="store", dest="sSocket", type="string",
+                       default=converterc.default_socket(),
+                       help="the Unix socket to serve on (defaults to %default)")
+    oParser.add_option("-j", "--jobs",
+                       action="store", dest="iJobs", type="int",
+                       default=0,
+                       help="the number of worker processes (defaults to the number of cpus)")
+    (oValues, lArguments) = oParser.parse_args(lArgs)
+    return serve(oValues.sSocket, oValues.iJobs)
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
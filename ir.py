@@ -0,0 +1,337 @@
+# -*- encoding: utf-8 -*-
+"""The records that the converter builds, between the input and the
+output: small slotted Record and Field objects instead of lxml elements,
+that cost far less to make and to keep, and that are written straight
+to bytes by tostring, without an lxml tree.
+
+They have the parts of the lxml element API that the converter, sqlout
+and the library users read: the tag, get(), keys() and items() of the
+attributes, the text, and the fields of a record by iterating it,
+len() and [], so that the records of the xmlfile files, that are still
+lxml elements, can be in the same lists. Maker makes them with the calls
+of lxml.builder.ElementMaker, and the attributes keep the order of its
+keyword arguments, as ElementMaker does, so the output is the same.
+
+The Field objects of a record are not changed once they are made:
+a change is a new Field, so that the copies of a record can share them.
+"""
+
+import re
+
+# the characters that libxml2 escapes in text, and in attributes
+oTextSpecial = re.compile(r'[&<>\r]')
+oAttribSpecial = re.compile(r'[&<>"\r\n\t]')
+
+class Field(object):
+    """A <field>: its attributes as a flat tuple of (name, value, ...),
+    in the order they are written, and its text, or None.
+    """
+    __slots__ = ('tAttrib', 'text',)
+
+    tag = 'field'
+    tail = None
+
+    def __init__(self, tAttrib, text=None):
+        self.tAttrib = tAttrib
+        self.text = text
+
+    def get(self, sKey, oDefault=None):
+        tAttrib = self.tAttrib
+        for i in range(0, len(tAttrib), 2):
+            if tAttrib[i] == sKey:
+                return tAttrib[i+1]
+        return oDefault
+
+    def keys(self):
+        return list(self.tAttrib[::2])
+
+    def items(self):
+        return zip(self.tAttrib[::2], self.tAttrib[1::2])
+
+    def __len__(self):
+        return 0
+
+    def __iter__(self):
+        return iter(())
+
+    def __getstate__(self):
+        return (self.tAttrib, self.text,)
+
+    def __setstate__(self, tState):
+        (self.tAttrib, self.text,) = tState
+
+    def __repr__(self):
+        return '<ir.Field %s>' % (' '.join(['%s=%r' % t for t in self.items()]),)
+
+# the kinds of the field_check of a field
+iRefs, iSearches, iCodes = range(3)
+
+def field_check(oField):
+    """(kind, ref or search or code, model searched,) of the field oField,
+    read from its attributes, or None if it has no ref, no search and is
+    not a code. A field with a ref is a ref, whatever else it has.
+    """
+    sRef = oField.get('ref')
+    if sRef is not None:
+        return (iRefs, sRef, None,)
+    sSearch = oField.get('search')
+    if sSearch is not None:
+        return (iSearches, sSearch, oField.get('model'),)
+    if oField.get('name') == 'code':
+        return (iCodes, oField.text, None,)
+    return None
+
+class Checks(object):
+    """What Converter.validate checks of a set of records, counted: their
+    ids, and the refs, the searches by the model they search, and the
+    codes by the model of their record, of their fields. The checks of
+    a field are taken away again with a count of -1 when it is replaced.
+    A Maker counts the fields as it makes them, and iFields and
+    iRecordFields are the number of Fields it has made, and of the fields
+    of the Records it has made: they are the same if each Field is in
+    one Record.
+    """
+
+    def __init__(self):
+        self.dRecords = dict()
+        self.dIds = dict()
+        self.dRefs = dict()
+        self.dSearches = dict()
+        self.dCodes = dict()
+        self.iFields = 0
+        self.iRecordFields = 0
+
+    def copy(self):
+        oChecks = Checks()
+        oChecks.dRecords = self.dRecords.copy()
+        oChecks.dIds = self.dIds.copy()
+        oChecks.dRefs = self.dRefs.copy()
+        oChecks.dSearches = dict([(s, d.copy(),)
+                                  for (s, d,) in self.dSearches.items()])
+        oChecks.dCodes = dict([(s, d.copy(),)
+                               for (s, d,) in self.dCodes.items()])
+        oChecks.iFields = self.iFields
+        oChecks.iRecordFields = self.iRecordFields
+        return oChecks
+
+    def add_record(self, e):
+        """Count the record e, a Record or an lxml element, and the checks
+        of its fields, read from them."""
+        self.dRecords[e] = True
+        sId = e.get('id')
+        self.dIds[sId] = self.dIds.get(sId, 0) + 1
+        sModel = e.get('model')
+        for oField in e:
+            tCheck = field_check(oField)
+            if tCheck is not None:
+                self.add(sModel, tCheck, 1)
+
+    def add(self, sModel, tCheck, iCount):
+        """Add iCount to the count of the field_check tCheck
+        of a field of a record of the model sModel."""
+        (iKind, sKey, sSearchModel,) = tCheck
+        if iKind == iRefs:
+            d = self.dRefs
+        elif iKind == iSearches:
+            d = self.dSearches.get(sSearchModel)
+            if d is None:
+                d = self.dSearches[sSearchModel] = dict()
+        else:
+            d = self.dCodes.get(sModel)
+            if d is None:
+                d = self.dCodes[sModel] = dict()
+        d[sKey] = d.get(sKey, 0) + iCount
+
+class Record(object):
+    """A <record> of the model sModel with the id sId, and its list of
+    Fields lFields, in order."""
+    __slots__ = ('sModel', 'sId', 'lFields',)
+
+    tag = 'record'
+    text = None
+    tail = None
+
+    def __init__(self, sModel, sId, lFields):
+        self.sModel = sModel
+        self.sId = sId
+        self.lFields = lFields
+
+    def get(self, sKey, oDefault=None):
+        if sKey == 'model':
+            return self.sModel
+        if sKey == 'id':
+            return self.sId
+        return oDefault
+
+    def keys(self):
+        return ['model', 'id']
+
+    def items(self):
+        return [('model', self.sModel,), ('id', self.sId,)]
+
+    def __len__(self):
+        return len(self.lFields)
+
+    def __iter__(self):
+        return iter(self.lFields)
+
+    def __getitem__(self, i):
+        return self.lFields[i]
+
+    def copy(self):
+        """A copy of the record, that shares its Fields, to change
+        the fields of, or put in another output, on its own."""
+        return Record(self.sModel, self.sId, list(self.lFields))
+
+    def __getstate__(self):
+        return (self.sModel, self.sId, self.lFields,)
+
+    def __setstate__(self, tState):
+        (self.sModel, self.sId, self.lFields,) = tState
+
+    def __repr__(self):
+        return '<ir.Record %s %s>' % (self.sModel, self.sId,)
+
+class Data(list):
+    """A <tryton> or <data>: a list of its children with a tag."""
+    __slots__ = ('tag',)
+
+    def __init__(self, tag, lChildren=()):
+        list.__init__(self, lChildren)
+        self.tag = tag
+
+    def __reduce__(self):
+        return (Data, (self.tag, list(self),))
+
+def text_of(lChildren):
+    """The text of the children of an ElementMaker call, that are all
+    strings, or None if there are none."""
+    sText = None
+    for s in lChildren:
+        if not isinstance(s, basestring):
+            raise TypeError("bad argument type: %s(%r)" % (type(s).__name__, s,))
+        sText = s if sText is None else sText + s
+    return sText
+
+class Maker(object):
+    """Make Records, Fields and Data with the calls of an ElementMaker:
+    m.record(*fields, model=..., id=...), m.field(text, name=..., ...),
+    and m.data(*records) and m.tryton(data).
+    With bChecked, it counts the Checks of the Records it makes in
+    oChecks from the arguments of their fields, as it makes them,
+    so that the fields do not have to be read back.
+    """
+
+    def __init__(self, bChecked=False):
+        self.oChecks = Checks() if bChecked else None
+        # the texts of the code fields made since the last Record,
+        # that are counted with the model of the Record
+        self.lCodes = []
+
+    def record(self, *lFields, **dAttrib):
+        oRecord = Record(dAttrib['model'], dAttrib['id'], list(lFields))
+        oChecks = self.oChecks
+        if oChecks is not None:
+            oChecks.dRecords[oRecord] = True
+            dIds = oChecks.dIds
+            dIds[oRecord.sId] = dIds.get(oRecord.sId, 0) + 1
+            oChecks.iRecordFields += len(lFields)
+            for sCode in self.lCodes:
+                oChecks.add(oRecord.sModel, (iCodes, sCode, None,), 1)
+            del self.lCodes[:]
+        return oRecord
+
+    def field(self, *lChildren, **dAttrib):
+        lAttrib = []
+        for t in dAttrib.items():
+            lAttrib.extend(t)
+        sText = text_of(lChildren)
+        oChecks = self.oChecks
+        if oChecks is not None:
+            # as field_check reads them back
+            oChecks.iFields += 1
+            if 'ref' in dAttrib:
+                dRefs = oChecks.dRefs
+                sRef = dAttrib['ref']
+                dRefs[sRef] = dRefs.get(sRef, 0) + 1
+            elif 'search' in dAttrib:
+                oChecks.add(None, (iSearches, dAttrib['search'],
+                                   dAttrib.get('model'),), 1)
+            elif dAttrib.get('name') == 'code':
+                self.lCodes.append(sText)
+        return Field(tuple(lAttrib), sText)
+
+    def data(self, *lChildren):
+        return Data('data', lChildren)
+
+    def tryton(self, *lChildren):
+        return Data('tryton', lChildren)
+
+def escape_text(s):
+    """Escape the text s as libxml2 does in the text of an element."""
+    if oTextSpecial.search(s) is None:
+        return s
+    return s.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') \
+           .replace('\r', '&#13;')
+
+def escape_attrib(s):
+    """Escape the value s as libxml2 does in a double quoted attribute."""
+    if oAttribSpecial.search(s) is None:
+        return s
+    return escape_text(s).replace('"', '&quot;').replace('\n', '&#10;') \
+           .replace('\t', '&#9;')
+
+class FieldFormats(dict):
+    """The format of a field in a record, with the number of its
+    attributes and values, made when it is first needed."""
+
+    def __init__(self, sEnd):
+        dict.__init__(self)
+        self.sEnd = sEnd
+
+    def __missing__(self, iAttrib):
+        sFormat = self[iAttrib] = \
+            '\n      <field' + ' %s="%s"' * (iAttrib / 2) + self.sEnd
+        return sFormat
+
+# the formats of the fields without text, and with it
+dEmptyFormats = FieldFormats('/>')
+dTextFormats = FieldFormats('>%s</field>')
+
+def tostring(e):
+    """The UTF-8 bytes of the Record e, indented as the records of a
+    <data> in a <tryton> are: each field on a line of its own.
+    """
+    # look for anything to escape in the record in one go: mostly
+    # there is nothing, and the values are written as they are
+    l = [e.sModel, e.sId]
+    for oField in e.lFields:
+        l.extend(oField.tAttrib)
+        if oField.text is not None:
+            l.append(oField.text)
+    bEscape = oAttribSpecial.search(''.join(l)) is not None
+    if bEscape:
+        sStart = '<record model="%s" id="%s"' % (escape_attrib(e.sModel),
+                                                 escape_attrib(e.sId),)
+    else:
+        sStart = '<record model="%s" id="%s"' % (e.sModel, e.sId,)
+    if not e.lFields:
+        return sStart + '/>'
+    l = [sStart, '>']
+    for oField in e.lFields:
+        tAttrib = oField.tAttrib
+        sText = oField.text
+        if bEscape:
+            tAttrib = tuple([s if i % 2 == 0 else escape_attrib(s)
+                             for i, s in enumerate(tAttrib)])
+            if sText is not None:
+                sText = escape_text(sText)
+        if sText is None:
+            l.append(dEmptyFormats[len(tAttrib)] % tAttrib)
+        else:
+            l.append(dTextFormats[len(tAttrib)] % (tAttrib + (sText,)))
+    l.append('\n    </record>')
+    s = ''.join(l)
+    if isinstance(s, unicode):
+        s = s.encode('utf-8')
+    return s
@@ -0,0 +1,71 @@
+# -*- encoding: utf-8 -*-
+"""Parse the literal values that OpenERP charts put in the eval
+attributes of their fields, without eval(): True, False, None,
+integers, floats, Decimal('...') and the empty list [].
+
+The values are memoised by their string, as a chart repeats
+the same few values in thousands of records.
+"""
+
+import re
+from decimal import Decimal, InvalidOperation
+
+dConstants = {'True': True, 'False': False, 'None': None}
+
+oInt = re.compile(r"^[-+]?\d+$")
+oFloat = re.compile(r"^[-+]?(\d+\.\d*|\.\d+|\d+)([eE][-+]?\d+)?$")
+oDecimal = re.compile(r"""^Decimal\((['"])([^'"]*)\1\)$""")
+oEmptyList = re.compile(r"^\[\s*\]$")
+
+# the parsed values by their string
+dMemo = dict()
+
+def parse(sValue):
+    """Parse the literal sValue, or raise a ValueError."""
+    s = sValue.strip()
+    if s in dConstants:
+        return dConstants[s]
+    if oInt.match(s):
+        return int(s)
+    if oFloat.match(s):
+        return float(s)
+    oMatch = oDecimal.match(s)
+    if oMatch:
+        try:
+            return Decimal(oMatch.group(2))
+        except InvalidOperation:
+            pass
+    if oEmptyList.match(s):
+        return []
+    raise ValueError("not a literal: %r" % (sValue,))
+
+def literal(sValue, sId=None):
+    """The value of the literal string sValue. A string that is not one
+    of the literals is rejected with a ValueError that names the id sId
+    of its record, if it is given.
+    """
+    try:
+        oValue = dMemo[sValue]
+    except KeyError:
+        try:
+            if sValue is None:
+                raise ValueError("no value to parse")
+            oValue = parse(sValue)
+        except ValueError, e:
+            if sId is None:
+                raise
+            raise ValueError("ID=%s %s" % (sId, e,))
+        dMemo[sValue] = oValue
+    if type(oValue) is list:
+        # dont share the memoised list
+        return []
+    return oValue
+
+def number(sValue, sId=None):
+    """The value of the literal string sValue, that has to be a number."""
+    oValue = literal(sValue, sId)
+    if type(oValue) not in (int, long, float, Decimal,):
+        if sId is None:
+            raise ValueError("not a number: %r" % (sValue,))
+        raise ValueError("ID=%s not a number: %r" % (sId, sValue,))
+    return oValue
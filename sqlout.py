@@ -0,0 +1,252 @@
+# -*- encoding: utf-8 -*-
+"""Write the records of the converter as SQL, to bulk load them
+straight into a database, instead of through the XML loader of the
+Tryton module installer, one record at a time.
+
+Each model is a table named after it (account.account.template is
+account_account_template), with a column for each field, and the
+records get surrogate ids 1, 2, 3... in each table, in output order,
+so that the parents come before their children. The refs and the
+searches by code are resolved to the surrogate ids; the ones that
+cannot be, like the refs to other modules, are left NULL and counted.
+The xml id of each record goes into ir_model_data, as the loader does.
+
+As the surrogate ids start at 1, the SQL is only for a database that
+has no rows yet in these tables: it provisions a new database, and
+does not add to one. For PostgreSQL, the sequence of each table is
+then set past its ids, so that the rows made later get new ones.
+
+There are three formats: INSERT statements of many rows each for
+PostgreSQL, the COPY format of psql, and the same INSERT statements
+without the sequences for SQLite. write_schema writes a stand-in
+schema for the tables, for SQLite, to test the SQL against.
+"""
+
+import re
+from collections import OrderedDict
+from decimal import Decimal
+
+import literals
+
+# the rows in each INSERT statement
+iBatchRows = 500
+
+# the searches by code that converter.map_fields writes
+oSearchByCode = re.compile(r"^\[\('code', '=', '(.*)'\)\]$")
+
+def table_name(sModel):
+    return sModel.replace('.', '_')
+
+def quote(sName):
+    """Quote a table or column name, as some fields, like group,
+    are SQL keywords."""
+    return '"%s"' % (sName,)
+
+class Table(object):
+    """The columns and rows of the records of one model."""
+    __slots__ = ('sModel', 'sTable', 'lColumns', 'dTypes', 'dTargets',
+                 'lRows', 'lXmlIds',)
+
+    def __init__(self, sModel):
+        self.sModel = sModel
+        self.sTable = table_name(sModel)
+        self.lColumns = []
+        # the SQL type, and the table that each ref column refers to
+        self.dTypes = dict()
+        self.dTargets = dict()
+        # a dict of column to value for each record, and its xml id
+        self.lRows = []
+        self.lXmlIds = []
+
+    def add_column(self, sColumn, sType, sTarget=None):
+        if sColumn not in self.dTypes:
+            self.lColumns.append(sColumn)
+            self.dTypes[sColumn] = sType
+        if sTarget:
+            self.dTargets[sColumn] = sTarget
+
+def eval_type(oValue):
+    if type(oValue) is bool:
+        return 'BOOLEAN'
+    if type(oValue) in (int, long,):
+        return 'INTEGER'
+    return 'NUMERIC'
+
+class Tables(object):
+    """The records of the output, as Tables of rows for each model,
+    with their refs and searches by code resolved to surrogate ids.
+    """
+
+    def __init__(self, lRecords):
+        lRecords = list(lRecords)
+        self.dTables = OrderedDict()
+        # the (table, surrogate id) of each xml id, and of each code
+        dIds = dict()
+        dCodes = dict()
+        for e in lRecords:
+            sModel = e.get('model')
+            if sModel not in self.dTables:
+                self.dTables[sModel] = Table(sModel)
+            oTable = self.dTables[sModel]
+            oTable.lXmlIds.append(e.get('id'))
+            tKey = (oTable.sTable, len(oTable.lXmlIds),)
+            dIds.setdefault(e.get('id'), tKey)
+            for oField in e:
+                if oField.get('name') == 'code' and oField.text:
+                    dCodes.setdefault((sModel, oField.text,), []).append(tKey)
+
+        self.iUnresolved = 0
+        for e in lRecords:
+            oTable = self.dTables[e.get('model')]
+            dRow = dict()
+            for oField in e:
+                sName = oField.get('name')
+                tKey = None
+                if oField.get('ref') is not None:
+                    tKey = dIds.get(oField.get('ref'))
+                    bRef = True
+                elif oField.get('search') is not None:
+                    oMatch = oSearchByCode.match(oField.get('search'))
+                    lKeys = oMatch and \
+                        dCodes.get((oField.get('model'), oMatch.group(1),))
+                    if lKeys and len(lKeys) == 1:
+                        tKey = lKeys[0]
+                    bRef = True
+                else:
+                    bRef = False
+                if bRef:
+                    if tKey is None:
+                        self.iUnresolved += 1
+                        oTable.add_column(sName, 'INTEGER')
+                        dRow[sName] = None
+                    else:
+                        oTable.add_column(sName, 'INTEGER', tKey[0])
+                        dRow[sName] = tKey[1]
+                elif oField.get('eval') is not None:
+                    oValue = literals.literal(oField.get('eval'), e.get('id'))
+                    if type(oValue) is list:
+                        oValue = None
+                    oTable.add_column(sName, eval_type(oValue))
+                    dRow[sName] = oValue
+                else:
+                    oTable.add_column(sName, 'VARCHAR')
+                    dRow[sName] = oField.text
+            oTable.lRows.append(dRow)
+
+    def tables(self):
+        return self.dTables.values()
+
+def sql_value(oValue):
+    if oValue is None:
+        return 'NULL'
+    if oValue is True:
+        return 'TRUE'
+    if oValue is False:
+        return 'FALSE'
+    if isinstance(oValue, (int, long, float, Decimal,)):
+        return str(oValue)
+    return "'" + oValue.replace("'", "''") + "'"
+
+def copy_value(oValue):
+    if oValue is None:
+        return '\\N'
+    if oValue is True:
+        return 't'
+    if oValue is False:
+        return 'f'
+    if isinstance(oValue, (int, long, float, Decimal,)):
+        return str(oValue)
+    return oValue.replace('\\', '\\\\').replace('\t', '\\t') \
+           .replace('\n', '\\n').replace('\r', '\\r')
+
+def encode(s):
+    if isinstance(s, unicode):
+        return s.encode('utf-8')
+    return s
+
+def write_setval(oFd, oTable):
+    """Set the PostgreSQL sequence of the table oTable past its ids."""
+    oFd.write("SELECT setval('%s_id_seq', %d);\n" % (
+        oTable.sTable, max(1, len(oTable.lRows)),))
+
+def write_insert(oFd, oTables, sModule, bSequences=True):
+    """Write the tables oTables as INSERT statements of iBatchRows rows,
+    and set the sequence of each table past its surrogate ids, unless
+    bSequences is false, for SQLite, that has no sequences.
+    """
+    oFd.write('BEGIN;\n')
+    for oTable in oTables.tables():
+        lColumns = ['id'] + oTable.lColumns
+        sInsert = 'INSERT INTO %s (%s) VALUES\n' % (
+            quote(oTable.sTable), ', '.join(map(quote, lColumns)),)
+        for iStart in range(0, len(oTable.lRows), iBatchRows):
+            lValues = []
+            for i, dRow in enumerate(oTable.lRows[iStart:iStart+iBatchRows]):
+                lRow = [str(iStart + i + 1)] + \
+                       [sql_value(dRow.get(s)) for s in oTable.lColumns]
+                lValues.append('(' + ', '.join(lRow) + ')')
+            oFd.write(sInsert)
+            oFd.write(encode(',\n'.join(lValues)))
+            oFd.write(';\n')
+    for oTable in oTables.tables():
+        sInsert = 'INSERT INTO ir_model_data (fs_id, model, module, db_id) VALUES\n'
+        for iStart in range(0, len(oTable.lXmlIds), iBatchRows):
+            lValues = []
+            for i, sId in enumerate(oTable.lXmlIds[iStart:iStart+iBatchRows]):
+                lValues.append('(%s, %s, %s, %d)' % (
+                    sql_value(sId), sql_value(oTable.sModel),
+                    sql_value(sModule), iStart + i + 1,))
+            oFd.write(sInsert)
+            oFd.write(encode(',\n'.join(lValues)))
+            oFd.write(';\n')
+    if bSequences:
+        for oTable in oTables.tables():
+            write_setval(oFd, oTable)
+    oFd.write('COMMIT;\n')
+
+def write_copy(oFd, oTables, sModule):
+    """Write the tables oTables in the COPY format of psql, and set
+    the sequence of each table past its surrogate ids.
+    """
+    for oTable in oTables.tables():
+        lColumns = ['id'] + oTable.lColumns
+        oFd.write('COPY %s (%s) FROM stdin;\n' % (
+            quote(oTable.sTable), ', '.join(map(quote, lColumns)),))
+        for i, dRow in enumerate(oTable.lRows):
+            lRow = [str(i + 1)] + \
+                   [copy_value(dRow.get(s)) for s in oTable.lColumns]
+            oFd.write(encode('\t'.join(lRow)))
+            oFd.write('\n')
+        oFd.write('\\.\n')
+        write_setval(oFd, oTable)
+    oFd.write('COPY ir_model_data (fs_id, model, module, db_id) FROM stdin;\n')
+    for oTable in oTables.tables():
+        for i, sId in enumerate(oTable.lXmlIds):
+            oFd.write(encode('\t'.join([copy_value(sId),
+                                        copy_value(oTable.sModel),
+                                        copy_value(sModule), str(i + 1)])))
+            oFd.write('\n')
+    oFd.write('\\.\n')
+
+def write_schema(oFd, oTables):
+    """Write a stand-in schema of the tables oTables, with the foreign
+    keys of the resolved refs, to test the SQL against in SQLite.
+    """
+    for oTable in oTables.tables():
+        lColumns = ['id INTEGER PRIMARY KEY']
+        for sColumn in oTable.lColumns:
+            sDefinition = '%s %s' % (quote(sColumn), oTable.dTypes[sColumn],)
+            if sColumn in oTable.dTargets:
+                sDefinition += ' REFERENCES %s (id)' % (
+                    quote(oTable.dTargets[sColumn]),)
+            lColumns.append(sDefinition)
+        oFd.write('CREATE TABLE %s (\n    %s\n);\n' % (
+            quote(oTable.sTable), ',\n    '.join(lColumns),))
+    oFd.write('CREATE TABLE ir_model_data (\n'
+              '    id INTEGER PRIMARY KEY,\n'
+              '    fs_id VARCHAR,\n'
+              '    model VARCHAR,\n'
+              '    module VARCHAR,\n'
+              '    db_id INTEGER\n'
+              ');\n'
+              'CREATE INDEX ir_model_data_fs_id ON ir_model_data (fs_id, module);\n')
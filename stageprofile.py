@@ -0,0 +1,172 @@
+# -*- encoding: utf-8 -*-
+"""A hook for the stages of the Converter, that measures the wall time,
+the CPU time, the number of records and the memory allocated by each
+stage, and reports them as JSON.
+
+The memory is measured with tracemalloc if it can be imported;
+otherwise it is the growth of the peak RSS of the process, which
+only shows the stages that push the peak up.
+
+The stage that takes the longest can also be dumped as cProfile
+stats, to load with pstats: every stage is profiled while the
+conversion runs, and only the stats of the slowest one that has no
+stages within it are kept.
+
+The stages that the Converter runs in a forked process, with --parallel,
+are measured there, and sent back to be merged into the report.
+"""
+
+import os
+import time
+import json
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def cpu_time():
+    """The user and system CPU time of this process in seconds."""
+    if resource is None:
+        t = os.times()
+        return t[0] + t[1]
+    oUsage = resource.getrusage(resource.RUSAGE_SELF)
+    return oUsage.ru_utime + oUsage.ru_stime
+
+def peak_rss():
+    """The peak resident set size of this process in bytes, or None."""
+    if resource is None:
+        return None
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def count_records(oResult):
+    """The number of records in the result of a stage, or None."""
+    if isinstance(oResult, (list, tuple)):
+        return len(oResult)
+    if isinstance(oResult, dict):
+        return sum([len(l) for l in oResult.values()
+                    if isinstance(l, (list, tuple))])
+    if hasattr(oResult, 'getroot'):
+        return len(oResult.xpath('/openerp/data/record'))
+    return None
+
+class ChildStats(object):
+    """The cProfile stats of a stage of a forked process,
+    that dump as those of a cProfile.Profile do.
+    """
+
+    def __init__(self, dStats):
+        self.dStats = dStats
+
+    def dump_stats(self, sFile):
+        import marshal
+        with open(sFile, 'wb') as oFd:
+            marshal.dump(self.dStats, oFd)
+
+class StageProfiler(object):
+    """A Converter hook: pass it in the lHooks of the Converter,
+    and report() or write() the measures of each stage once it is done.
+    """
+
+    def __init__(self, sDumpFile=None):
+        self.sDumpFile = sDumpFile
+        self.lStages = []
+        self.lRunning = []
+        self.tSlowest = None
+        self.sMemory = 'tracemalloc' if tracemalloc else 'peak_rss'
+        if tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def before_stage(self, oConverter, sName):
+        oProfile = None
+        if self.sDumpFile:
+            if self.lRunning and self.lRunning[-1][4]:
+                # a stage within a stage: cProfile cannot nest
+                self.lRunning[-1][4].disable()
+            import cProfile
+            oProfile = cProfile.Profile()
+        if tracemalloc:
+            iMemory = tracemalloc.get_traced_memory()[0]
+        else:
+            iMemory = peak_rss()
+        self.lRunning.append([sName, time.time(), cpu_time(), iMemory,
+                              oProfile, False])
+        if oProfile:
+            oProfile.enable()
+
+    def after_stage(self, oConverter, sName, oResult):
+        (sStarted, fWall, fCpu, iMemory, oProfile, bOuter,) = self.lRunning.pop()
+        if oProfile:
+            oProfile.disable()
+        assert sStarted == sName, "Stage %s ended inside %s" % (sName, sStarted,)
+        fWall = time.time() - fWall
+        fCpu = cpu_time() - fCpu
+        if tracemalloc:
+            iMemory = tracemalloc.get_traced_memory()[0] - iMemory
+        elif iMemory is not None:
+            iMemory = peak_rss() - iMemory
+        self.lStages.append(dict(stage=sName,
+                                 depth=len(self.lRunning),
+                                 wall=fWall,
+                                 cpu=fCpu,
+                                 records=count_records(oResult),
+                                 memory=iMemory,
+                                 ))
+        if self.lRunning:
+            self.lRunning[-1][5] = True
+        if oProfile:
+            if not bOuter and \
+                   (self.tSlowest is None or fWall > self.tSlowest[1]):
+                self.tSlowest = (sName, fWall, oProfile,)
+            if self.lRunning and self.lRunning[-1][4]:
+                self.lRunning[-1][4].enable()
+
+    def start_child(self):
+        """Called in a forked process of the Converter, before it runs
+        stages of its own, to send back with child_report.
+        """
+        self.iChildStages = len(self.lStages)
+        self.tSlowest = None
+
+    def child_report(self):
+        """The measures of the stages of this forked process, that pickle."""
+        tSlowest = None
+        if self.tSlowest:
+            (sName, fWall, oProfile,) = self.tSlowest
+            oProfile.create_stats()
+            tSlowest = (sName, fWall, oProfile.stats,)
+        return (self.lStages[self.iChildStages:], tSlowest,)
+
+    def merge_child(self, tReport):
+        """Add the measures of the child_report tReport of a forked process."""
+        (lStages, tSlowest,) = tReport
+        self.lStages.extend(lStages)
+        if tSlowest and \
+               (self.tSlowest is None or tSlowest[1] > self.tSlowest[1]):
+            (sName, fWall, dStats,) = tSlowest
+            self.tSlowest = (sName, fWall, ChildStats(dStats),)
+
+    def report(self):
+        dReport = dict(memory=self.sMemory,
+                       stages=self.lStages,
+                       )
+        if self.tSlowest:
+            dReport['slowest'] = self.tSlowest[0]
+            dReport['dump'] = self.sDumpFile
+        return dReport
+
+    def write(self, sFile):
+        """Write the report to the JSON file sFile, and the cProfile
+        stats of the slowest stage to the dump file, if there is one.
+        """
+        if self.tSlowest:
+            self.tSlowest[2].dump_stats(self.sDumpFile)
+        with open(sFile, 'w') as oFd:
+            json.dump(self.report(), oFd, indent=2, sort_keys=True)
+            oFd.write('\n')
@@ -0,0 +1,70 @@
+# -*- encoding: utf-8 -*-
+"""A stress test of Converters of different languages running at the
+same time in one process: the UK chart is converted in the en and nl
+languages, with and without a taxfile, sequentially first, and then
+many times over on a pool of threads, and every output has to be the
+same as the sequential one of its language.
+
+The NL chart does not convert yet, so both languages use the UK chart.
+
+usage: python test_threads.py [ROUNDS [THREADS]]
+"""
+
+import sys, os
+from StringIO import StringIO
+from multiprocessing.pool import ThreadPool
+
+sTopDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, sTopDir)
+import converter
+
+sInfile = os.path.join(sTopDir, 'charts', 'oerp7_chart_l10n_uk.xml')
+sConfigFile = os.path.join(sTopDir, 'en.cfg')
+
+# (lang, taxfile,) of each of the conversions
+lTargets = [(sLang, sTaxfile,) for sLang in sorted(converter.dLang)
+            for sTaxfile in [None, 'taxes.xml']]
+
+def convert(tTarget):
+    """Convert the UK chart for the target tTarget, and return the output."""
+    (sLang, sTaxfile,) = tTarget
+    oConfig = converter.ChartConfig.read(sConfigFile)
+    oConverter = converter.Converter(sInfile, oConfig=oConfig,
+                                     oValues=converter.default_values(
+                                         sLang=sLang, sTaxfile=sTaxfile))
+    lOutputs = []
+    for oTree in [oConverter.outtree, oConverter.taxtree]:
+        if oTree is not None:
+            oFd = StringIO()
+            converter.write_records(oFd, oTree[0])
+            lOutputs.append(oFd.getvalue())
+    return (tTarget, lOutputs,)
+
+def main(lArgs):
+    iRounds = int(lArgs[0]) if lArgs else 10
+    iThreads = int(lArgs[1]) if len(lArgs) > 1 else 8
+    # the xmlfile files of the config are relative to the charts
+    os.chdir(os.path.join(sTopDir, 'charts'))
+    dExpected = dict([convert(tTarget) for tTarget in lTargets])
+    assert len(set([tuple(l) for l in dExpected.values()])) == len(lTargets), \
+        "the targets should all have different outputs"
+
+    oPool = ThreadPool(iThreads)
+    iFailed = 0
+    iRun = 0
+    try:
+        for (tTarget, lOutputs,) in oPool.imap_unordered(convert,
+                                                         lTargets * iRounds):
+            iRun += 1
+            if lOutputs != dExpected[tTarget]:
+                iFailed += 1
+                sys.stderr.write("FAIL lang=%s taxfile=%s\n" % tTarget)
+    finally:
+        oPool.close()
+        oPool.join()
+    sys.stderr.write("%d of %d conversions on %d threads differ from the sequential ones\n" % (
+        iFailed, iRun, iThreads,))
+    return 1 if iFailed else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))